@@ -158,7 +158,7 @@ setup(
     # installed, specify them here.  If using Python 2.6 or less, then these
     # have to be included in MANIFEST.in as well.
     package_data={
-        "webmake": ["package.json", "cordova/hooks/before_prepare/runwebmake.py"],
+        "webmake": ["package.json", "js/*.js", "cordova/hooks/before_prepare/runwebmake.py"],
     },
     # Although 'package_data' is the preferred approach, in some case you may
     # need to place data files outside of your packages. See:
@@ -0,0 +1,48 @@
+import os
+import threading
+
+import pytest
+
+from webmake import api, compiler
+from webmake.modules.utils import StaticCompilerError
+
+
+def outputs(targets):
+    return [t["output"] for t in targets]
+
+
+def select(patterns):
+    targets = [
+        api.concatenate(["src/a.css"], "www/a.css"),
+        api.concatenate(["src/b.css"], "www/css/base.css"),
+    ]
+    return outputs(compiler.select_targets(targets, [os.path.abspath(p) for p in patterns]))
+
+
+def test_select_targets_star_does_not_cross_directories():
+    assert select(["www/*.css"]) == ["www/a.css"]
+    assert select(["www/*"]) == ["www/a.css"]
+
+
+def test_select_targets_double_star_crosses_directories():
+    assert select(["www/**/*.css"]) == ["www/a.css", "www/css/base.css"]
+    assert select(["**/base.css"]) == ["www/css/base.css"]
+
+
+def test_compile_batch_runs_a_failed_batch_once():
+    calls = []
+
+    def batch_fn(jobs, release=False):
+        calls.append(jobs)
+        raise StaticCompilerError("Failed to compile batch")
+
+    targets = [
+        api.concatenate(["src/a.css"], "www/a.css"),
+        api.concatenate(["src/b.css"], "www/b.css"),
+    ]
+    batch = {"compiler_fn": batch_fn, "targets": targets, "lock": threading.Lock()}
+
+    for target in targets:
+        with pytest.raises(StaticCompilerError):
+            compiler.compile_batch(batch, target, release=False)
+    assert len(calls) == 1
@@ -0,0 +1,13 @@
+from webmake import statcache
+from webmake.modules import less
+
+
+def test_less_import_cycle_lists_each_file_once(tmp_path):
+    a = tmp_path / "a.less"
+    b = tmp_path / "b.less"
+    a.write_text('@import "b";\n')
+    b.write_text('@import "a.less";\n')
+    statcache.reset()
+
+    assert less.less_dependencies(str(a)) == [str(a), str(b)]
+    assert less.less_dependencies(str(b)) == [str(b), str(a)]
@@ -0,0 +1,15 @@
+from webmake import statcache
+from webmake.modules import sass
+
+
+def test_sass_use_resolves_index_files_and_skips_load_path_modules(tmp_path):
+    main = tmp_path / "main.scss"
+    index = tmp_path / "components" / "_index.scss"
+    button = tmp_path / "components" / "_button.scss"
+    index.parent.mkdir()
+    main.write_text('@use "sass:math";\n@use "components";\n@use "bootstrap/scss/mixins";\n')
+    index.write_text('@forward "button";\n')
+    button.write_text("a { color: red; }\n")
+    statcache.reset()
+
+    assert sass.sass_dependencies(str(main)) == [str(main), str(index), str(button)]
@@ -0,0 +1,65 @@
+import os
+import time
+
+import pytest
+from watchdog.events import FileCreatedEvent
+
+from webmake import api, compiler, settings, statcache, watcher
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "a.txt").write_text("a")
+    makefilepath = str(tmp_path / "webmakefile.py")
+    (tmp_path / "webmakefile.py").write_text("MAKEFILE = []\n")
+
+    monkeypatch.setattr(settings, "MAKEFILEPATH", makefilepath)
+    monkeypatch.setattr(settings, "MAKEFILE", [api.copy_files("src", "out")])
+    monkeypatch.setattr(settings, "CACHE_DIR", str(tmp_path / "webmakefile.py.cache"))
+    monkeypatch.setattr(settings, "WATCH", True)
+    statcache.reset()
+
+    assert compiler.compile_if_modified(settings.MAKEFILE, makefilepath, release=False)
+    return tmp_path
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def test_new_file_in_copied_directory_is_copied(project):
+    handler = watcher.WatchdogEventHandler(lambda: None, lambda path: None)
+    try:
+        # Warm the stat cache, as the previous builds of a watch session do
+        compiler.compile_if_modified(settings.MAKEFILE, settings.MAKEFILEPATH, release=False)
+
+        time.sleep(0.01)
+        new_file = project / "src" / "b.txt"
+        new_file.write_text("b")
+        handler.on_any_event(FileCreatedEvent(str(new_file)))
+
+        assert wait_for(lambda: os.path.exists(project / "out" / "b.txt"))
+    finally:
+        handler.stop()
+        handler.thread.join(5)
+
+
+def test_new_dependency_on_another_targets_output_is_indexed(project):
+    targets = [
+        api.concatenate(["src/a.txt"], "out/a.css"),
+        api.concatenate(["src/b.txt"], "out/b.css"),
+    ]
+    index = watcher.DependencyIndex(targets)
+    assert index.affected([os.path.abspath("src/a.txt")]) == [0]
+
+    # Recompiling finds a new dependency on the first target's output
+    targets[1]["dependencies"] = [os.path.abspath("out/a.css")]
+    index.update([1])
+    assert index.affected([os.path.abspath("src/a.txt")]) == [0, 1]
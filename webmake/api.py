@@ -114,6 +114,7 @@ def compile_less(input_file, output_file):
     return {
         "dependencies_fn": less.less_dependencies,
         "compiler_fn": less.less_compile,
+        "batch_compiler_fn": less.less_compile_batch,
         "input": input_file,
         "output": output_file,
         "kwargs": {},
@@ -132,13 +133,15 @@ def compile_sass(input_file, output_file):
     return {
         "dependencies_fn": sass.sass_dependencies,
         "compiler_fn": sass.sass_compile,
+        "batch_compiler_fn": sass.sass_compile_batch,
+        "dependencies_from_compiler": True,
         "input": input_file,
         "output": output_file,
         "kwargs": {},
     }
 
 
-def browserify_node_modules(module_name_list, output_file, babelify=False):
+def browserify_node_modules(module_name_list, output_file, babelify=False, track_by_lockfile=False):
     """
     Browserify a list of libraries from node_modules into a single
     javascript file. Generates source maps in debug mode. Minifies the
@@ -146,6 +149,10 @@ def browserify_node_modules(module_name_list, output_file, babelify=False):
 
     Note you may also specify the relative path to the module
     as ``./path/to/module`` or ``./path/to/module/file.js``.
+
+    With ``track_by_lockfile``, the bundle depends on ``package.json``,
+    ``package-lock.json`` and each listed module's ``package.json`` instead
+    of every file in ``node_modules``, which only change on ``npm install``.
     """
     from .modules import browserify
 
@@ -157,10 +164,12 @@ def browserify_node_modules(module_name_list, output_file, babelify=False):
     return {
         "dependencies_fn": browserify.browserify_deps_node_modules,
         "compiler_fn": browserify.browserify_compile_node_modules,
+        "dependencies_from_compiler": True,
         "input": module_name_list,
         "output": output_file,
         "kwargs": {
             "babelify": babelify,
+            "track_by_lockfile": track_by_lockfile,
         },
     }
 
@@ -186,6 +195,7 @@ def browserify_libs(lib_dirs, output_file, babelify=False):
     return {
         "dependencies_fn": browserify.browserify_deps_libs,
         "compiler_fn": browserify.browserify_compile_libs,
+        "dependencies_from_compiler": True,
         "input": lib_dirs,
         "output": output_file,
         "kwargs": {
@@ -213,6 +223,7 @@ def browserify_file(entry_point, output_file, babelify=False, export_as=None):
     return {
         "dependencies_fn": browserify.browserify_deps_file,
         "compiler_fn": browserify.browserify_compile_file,
+        "dependencies_from_compiler": True,
         "input": entry_point,
         "output": output_file,
         "kwargs": {
@@ -222,6 +233,41 @@ def browserify_file(entry_point, output_file, babelify=False, export_as=None):
     }
 
 
+def browserify_factor_bundle(entry_points, output_files, common_output_file, babelify=False):
+    """
+    Browserify several javascript entry points in a single run, into one
+    bundle per entry point plus a common bundle containing the modules
+    shared between them (using ``factor-bundle``). Generates source maps
+    in debug mode. Minifies the output in release mode.
+
+    ``output_files`` lists the output bundle for each entry point, in the
+    same order. The page for each entry point must load the common bundle
+    before its own.
+    """
+    from .modules import browserify
+
+    if not isinstance(entry_points, (list, tuple)) or not isinstance(output_files, (list, tuple)):
+        raise RuntimeError(
+            "Browserify Factor Bundle compiler takes a list of entry points and output files."
+        )
+
+    if len(entry_points) != len(output_files):
+        raise RuntimeError("Browserify Factor Bundle needs one output file per entry point.")
+
+    return {
+        "dependencies_fn": browserify.browserify_deps_factor_bundle,
+        "compiler_fn": browserify.browserify_compile_factor_bundle,
+        "dependencies_from_compiler": True,
+        "input": entry_points,
+        "output": common_output_file,
+        "extra_outputs": list(output_files),
+        "kwargs": {
+            "babelify": babelify,
+            "output_files": list(output_files),
+        },
+    }
+
+
 def custom_function(func, input_files, output_file):
     """
     Calls a custom function which must create the output file.
@@ -0,0 +1,236 @@
+import os
+import json
+import stat
+import shutil
+import hashlib
+import threading
+import subprocess
+from . import settings, graph, fingerprint, depscache, statcache, remotecache
+from .modules import utils
+
+
+_lock = threading.Lock()
+_tool_versions = None
+
+
+def artifacts_dir():
+    return os.path.join(settings.CACHE_DIR, "artifacts")
+
+
+def get_tool_versions():
+    """
+    Returns the versions of node and all webmake's node modules, which
+    are part of every artifact key.
+    """
+    global _tool_versions
+    if _tool_versions is None:
+        with open(os.path.join(os.path.dirname(__file__), "package.json")) as f:
+            modules = sorted(json.load(f)["dependencies"])
+
+        try:
+            node = subprocess.check_output(["node", "--version"]).decode("ascii").strip()
+        except (OSError, subprocess.CalledProcessError):
+            node = None
+
+        versions = {m: utils.get_node_module_version(m) for m in modules}
+        versions["node"] = node
+        _tool_versions = versions
+
+    return _tool_versions
+
+
+def is_cacheable(target):
+    """
+    Only webmake's own compilers producing files can be cached, since
+    custom functions may depend on anything. Targets modifying their
+    input in place can't be cached either.
+    """
+    module = getattr(target["compiler_fn"], "__module__", "") or ""
+    if not module.startswith("webmake.modules."):
+        return False
+
+    inputs = graph.target_inputs(target)
+    for output in graph.target_outputs(target):
+        st = statcache.stat(output)
+        if output in inputs or (st is not None and stat.S_ISDIR(st.st_mode)):
+            return False
+
+    return True
+
+
+def artifact_key(target, makefilepath, release):
+    """
+    Returns the key identifying the outputs of ``target`` from its
+    configuration, the tool versions and the contents of its dependencies,
+    or ``None`` if the dependencies aren't known or can't be read.
+    """
+    deps = target.get("dependencies")
+    if not deps or not is_cacheable(target):
+        return None
+
+    fingerprints = target.get("fingerprints") or {}
+    digests = []
+    for dep in deps:
+        if dep == makefilepath:
+            continue
+        fp = fingerprint.fingerprint(dep, fingerprints.get(dep))
+        if not fp:
+            return None
+        digests.append([utils.relative_path(dep), fp[2]])
+
+    key = {
+        "config": depscache.target_config_hash(target),
+        "release": bool(release),
+        "tools": get_tool_versions(),
+        "dependencies": digests,
+    }
+    data = json.dumps(key, sort_keys=True)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _entry_dir(key):
+    return os.path.join(artifacts_dir(), key[:2], key)
+
+
+def _output_files(target):
+    """
+    Returns ``(name, path)`` pairs for each output and source map of a target.
+    """
+    files = []
+    for i, output in enumerate(graph.target_outputs(target)):
+        files.append((str(i), output))
+        files.append(("{}.map".format(i), output + ".map"))
+    return files
+
+
+def is_cached(key):
+    """
+    Checks whether there's an entry for ``key``, fetching it from the
+    remote cache into the local cache if needed.
+    """
+    entry = _entry_dir(key)
+    if not os.path.isdir(entry) and remotecache.is_enabled():
+        utils.ensure_path_exists(os.path.dirname(entry))
+        remotecache.fetch(key, entry)
+    return os.path.isdir(entry)
+
+
+def restore(key, target, makefilepath):
+    """
+    Copies the cached outputs for ``key`` into place, and restores the
+    target's dependencies.
+
+    :returns: ``True`` on a cache hit.
+    """
+    entry = _entry_dir(key)
+    is_cached(key)
+
+    try:
+        with open(os.path.join(entry, "meta.json")) as f:
+            meta = json.load(f)
+    except (IOError, ValueError):
+        return False
+
+    try:
+        for name, path in _output_files(target):
+            src = os.path.join(entry, name)
+            if name not in meta["files"]:
+                utils.ensure_deleted(path)
+                continue
+            utils.ensure_path_exists(os.path.dirname(path))
+            shutil.copyfile(src, path + ".tmp")
+            os.replace(path + ".tmp", path)
+    except (IOError, OSError) as e:
+        utils.logv("Failed restoring from build cache: {}", e)
+        for _, path in _output_files(target):
+            utils.ensure_deleted(path + ".tmp", path)
+        return False
+    finally:
+        statcache.invalidate(graph.target_outputs(target), recursive=True)
+
+    # Mark as recently used
+    try:
+        os.utime(entry, None)
+    except OSError:
+        pass
+
+    target["dependencies"] = [makefilepath] + [os.path.abspath(p) for p in meta["dependencies"]]
+    return True
+
+
+def store(target, makefilepath, release):
+    """
+    Adds the freshly compiled outputs of ``target`` to the cache (and the
+    remote cache), and evicts the least recently used entries if it's grown too big.
+    """
+    key = artifact_key(target, makefilepath, release)
+    if not key:
+        return None
+
+    entry = _entry_dir(key)
+    if os.path.isdir(entry):
+        return key
+
+    tmp_entry = "{}.tmp{}".format(entry, threading.get_ident())
+    try:
+        utils.ensure_path_exists(tmp_entry)
+        files = []
+        for name, path in _output_files(target):
+            if os.path.isfile(path):
+                shutil.copyfile(path, os.path.join(tmp_entry, name))
+                files.append(name)
+
+        meta = {
+            "output": target["output"],
+            "files": files,
+            "dependencies": [
+                utils.relative_path(p) for p in target["dependencies"] if p != makefilepath
+            ],
+        }
+        with open(os.path.join(tmp_entry, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+        os.rename(tmp_entry, entry)
+    except (IOError, OSError) as e:
+        utils.logv("Failed writing to build cache: {}", e)
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        return None
+
+    remotecache.upload(key, entry)
+    evict(settings.BUILD_CACHE_SIZE)
+    return key
+
+
+def _dir_size(path):
+    total = 0
+    for entry in os.scandir(path):
+        if entry.is_file(follow_symlinks=False):
+            total += entry.stat(follow_symlinks=False).st_size
+    return total
+
+
+def evict(max_size):
+    """
+    Deletes the least recently used entries until the cache is no bigger
+    than ``max_size`` bytes.
+    """
+    with _lock:
+        entries = []
+        root = artifacts_dir()
+        try:
+            for prefix in os.scandir(root):
+                if not prefix.is_dir():
+                    continue
+                for entry in os.scandir(prefix.path):
+                    if entry.is_dir() and ".tmp" not in entry.name:
+                        entries.append((entry.stat().st_mtime, _dir_size(entry.path), entry.path))
+        except OSError:
+            return
+
+        total = sum(e[1] for e in entries)
+        for _, size, path in sorted(entries):
+            if total <= max_size:
+                break
+            utils.logv("Evicting from build cache: {}", os.path.basename(path))
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
@@ -1,14 +1,22 @@
-import os
-import json
+import fnmatch
+import functools
+import threading
+from . import settings, scheduler, graph, fingerprint, depscache, statcache, profiler
+from . import buildcache
 from .modules.utils import log, logv, StaticCompilerError
 
 
+UP_TO_DATE = "up-to-date"
+
+
 def load_dependencies_for_target(target, makefilepath):
     logv("\nFinding dependencies for: {}".format(target["output"]))
     try:
         dependency_fn = target["dependencies_fn"]
-        target["dependencies"] = [makefilepath] + dependency_fn(target["input"], **target["kwargs"])
-    except (IOError, OSError) as e:
+        with profiler.span("dependencies " + target["output"], "dependencies", target["output"]):
+            deps = dependency_fn(target["input"], **target["kwargs"])
+        target["dependencies"] = [makefilepath] + deps
+    except (IOError, OSError, ValueError) as e:
         msg = '\nERROR: Failed loading dependencies for "{}":\n\nReceived error:\n{}'.format(
             target["output"], str(e)
         )
@@ -21,50 +29,48 @@ def load_dependencies_for_target(target, makefilepath):
     return True
 
 
-def save_dependencies_to_cache(targets, makefilepath):
-    cachefile = makefilepath + ".depscache"
-    logv("\nWriting dependencies cache: {}".format(cachefile))
-
-    cache = [
-        {"output": t["output"], "dependencies": t["dependencies"]}
-        for t in targets
-        if "dependencies" in t
-    ]
+def load_dependencies_from_cache(targets, makefilepath):
+    with profiler.span("load dependencies cache", "cache"):
+        depscache.load(targets, makefilepath)
 
-    with open(cachefile, "w") as f:
-        json.dump(cache, f, indent=4)
 
+def dependencies_are_unchanged(target):
+    """
+    Content fingerprint version of ``dependencies_are_up_to_date()``.
 
-def load_dependencies_from_cache(targets, makefilepath):
-    cachefile = makefilepath + ".depscache"
-    try:
-        with open(cachefile, "r") as f:
-            cache = json.load(f)
-    except IOError:
-        return
+    :returns: A tuple ``(unchanged, refreshed)``, where ``refreshed`` is
+        ``True`` if any stored fingerprints were updated for touched files.
+    """
+    deps = target.get("dependencies")
+    fingerprints = target.get("fingerprints")
 
-    for i, entry in enumerate(cache):
-        output = entry["output"]
-        deps = entry["dependencies"]
+    if not deps or not all(statcache.exists(o) for o in graph.target_outputs(target)):
+        return (False, False)
 
-        if i >= len(targets):
-            break
+    # No fingerprints yet, fall back to timestamps and record them if up-to-date
+    if fingerprints is None:
+        if not dependencies_are_up_to_date(target):
+            return (False, False)
+        target["fingerprints"] = fingerprint.fingerprint_files(deps)
+        return (True, True)
 
-        if targets[i]["output"] == output:
-            targets[i]["dependencies"] = deps
+    return fingerprint.files_are_unchanged(deps, fingerprints)
 
 
 def dependencies_are_up_to_date(target):
-    output = target["output"]
+    outputs = graph.target_outputs(target)
     deps = target.get("dependencies")
-    last_compiled_timestamp = os.path.getmtime(output) if os.path.exists(output) else -1
+    if all(statcache.exists(o) for o in outputs):
+        last_compiled_timestamp = min(statcache.getmtime(o) for o in outputs)
+    else:
+        last_compiled_timestamp = -1
 
     if not deps:
         return False
 
     for file in deps:
         try:
-            if os.path.getmtime(file) >= last_compiled_timestamp:
+            if statcache.getmtime(file) >= last_compiled_timestamp:
                 return False
         except Exception:
             return False
@@ -72,43 +78,246 @@ def dependencies_are_up_to_date(target):
     return True
 
 
-def compile_if_modified(targets, makefilepath, release):
-    modified = False
+def _build(targets, makefilepath, release, force):
     first_up_to_date = True
 
-    for target in targets:
-        if dependencies_are_up_to_date(target):
+    predecessors = graph.build_graph(targets)
+    cycle = graph.find_cycle(predecessors)
+    if cycle:
+        log(
+            "\nERROR: Circular dependency between targets:\n\n{}".format(
+                "\n-> ".join(targets[i]["output"] for i in cycle)
+            )
+        )
+        return False
+
+    # In watch mode the stat cache is invalidated by filesystem events instead
+    if not settings.WATCH:
+        statcache.reset()
+
+    # Targets rebuilt during this pass make everything downstream stale
+    rebuilt = set()
+    refreshed = set()
+    index_of = {id(t): i for i, t in enumerate(targets)}
+
+    def is_up_to_date(target):
+        with profiler.span("check " + target["output"], "check", target["output"]):
+            if not settings.CONTENT_HASH:
+                return dependencies_are_up_to_date(target)
+
+            unchanged, fingerprints_refreshed = dependencies_are_unchanged(target)
+            if fingerprints_refreshed:
+                refreshed.add(id(target))
+            return unchanged
+
+    # Out-of-date stylesheet targets which don't depend on other targets
+    # are compiled together, in one batch per compiler
+    up_to_date = set()
+    cache_keys = {}
+    batches = {}
+    for i, target in enumerate(targets):
+        batch_fn = target.get("batch_compiler_fn")
+        if not batch_fn or predecessors[i]:
+            continue
+        if not force and is_up_to_date(target):
+            up_to_date.add(i)
+            continue
+
+        key = build_cache_key(target, makefilepath, release)
+        if key:
+            cache_keys[i] = key
+        else:
+            batches.setdefault(batch_fn, []).append(target)
+
+    batch_of = {}
+    for batch_fn, batch in batches.items():
+        batch = {"compiler_fn": batch_fn, "targets": batch, "lock": threading.Lock()}
+        batch_of.update((id(t), batch) for t in batch["targets"])
+
+    def build_target(target):
+        i = index_of[id(target)]
+        if i in up_to_date:
+            return UP_TO_DATE
+        if i in cache_keys:
+            return compile_target(target, makefilepath, release=release, key=cache_keys[i])
+
+        batch = batch_of.get(id(target))
+        if batch:
+            compile_fn = functools.partial(compile_batch, batch, target, release)
+            return compile_target(target, makefilepath, release=release, compile_fn=compile_fn)
+
+        stale = force or any(p in rebuilt for p in predecessors[i])
+        if not stale and is_up_to_date(target):
+            return UP_TO_DATE
+        return compile_target(target, makefilepath, release=release)
+
+    def on_complete(target, result):
+        nonlocal first_up_to_date
+        if result == UP_TO_DATE:
             if first_up_to_date:
                 logv("")
                 first_up_to_date = False
             logv("Up-to-date: {}", target["output"])
+            if id(target) in refreshed:
+                depscache.save(target, makefilepath)
         else:
-            modified = True
             first_up_to_date = True
-            if not compile_target(target, makefilepath, release=release):
-                return False
+            rebuilt.add(index_of[id(target)])
+            if result:
+                depscache.save(target, makefilepath)
 
-    if modified:
-        save_dependencies_to_cache(targets, makefilepath)
+    results = scheduler.run(
+        targets,
+        predecessors,
+        build_target,
+        jobs=settings.JOBS,
+        keep_going=settings.KEEP_GOING,
+        on_complete=on_complete,
+    )
 
-    return True
+    if settings.PROFILE:
+        profiler.finish(makefilepath + ".trace.json")
+
+    if settings.KEEP_GOING and False in results:
+        log_failure_summary(targets, results)
+
+    return False not in results
+
+
+def log_failure_summary(targets, results):
+    failed = [t["output"] for t, r in zip(targets, results) if r is False]
+    skipped = [t["output"] for t, r in zip(targets, results) if r is None]
+
+    msg = ["\nBUILD FAILED: {} target(s) failed to compile:\n".format(len(failed))]
+    msg.extend("    {}\n".format(o) for o in failed)
+    if skipped:
+        msg.append("\nSkipped {} target(s) depending on them:\n".format(len(skipped)))
+        msg.extend("    {}\n".format(o) for o in skipped)
+
+    log("".join(msg))
+
+
+def path_matches(path, pattern):
+    """
+    Matches ``path`` against a glob ``pattern`` one path component at a
+    time, so ``*`` doesn't match across directories but ``**`` matches any
+    number of them.
+    """
+
+    def split(p):
+        return [c for c in p.replace("\\", "/").split("/") if c]
+
+    def match(parts, pats):
+        if not pats:
+            return not parts
+        if pats[0] == "**":
+            return any(match(parts[i:], pats[1:]) for i in range(len(parts) + 1))
+        return bool(parts) and fnmatch.fnmatch(parts[0], pats[0]) and match(parts[1:], pats[1:])
+
+    return match(split(path), split(pattern))
+
+
+def select_targets(targets, patterns):
+    """
+    Returns the targets whose output matches any of the absolute path or
+    glob ``patterns``, plus all targets they depend on, in makefile order.
+    """
+    matched = [
+        i
+        for i, target in enumerate(targets)
+        if any(
+            path_matches(output, pattern)
+            for output in graph.target_outputs(target)
+            for pattern in patterns
+        )
+    ]
+
+    selected = set(matched) | graph.ancestors(graph.build_graph(targets), matched)
+    return [t for i, t in enumerate(targets) if i in selected]
+
+
+def compile_if_modified(targets, makefilepath, release):
+    return _build(targets, makefilepath, release, force=False)
 
 
 def compile_all(targets, makefilepath, release):
-    for target in targets:
-        if not compile_target(target, makefilepath, release=release):
-            return False
+    return _build(targets, makefilepath, release, force=True)
+
+
+def build_cache_key(target, makefilepath, release):
+    """
+    Returns the target's build cache key if it's in the build cache, or ``None``.
+    """
+    if not settings.BUILD_CACHE:
+        return None
+    key = buildcache.artifact_key(target, makefilepath, release)
+    return key if key and buildcache.is_cached(key) else None
 
-    save_dependencies_to_cache(targets, makefilepath)
-    return True
 
+def compile_batch(batch, target, release):
+    """
+    Compiles all targets in ``batch`` with its ``batch_compiler_fn`` the
+    first time it's called for any of them, then returns the outcome for
+    ``target``, raising its error if it failed.
+    """
+    with batch["lock"]:
+        if "results" not in batch:
+            targets = batch["targets"]
+            if len(targets) > 1:
+                logv("\nCompiling together: {}", ", ".join(t["output"] for t in targets))
+            jobs = [(t["input"], t["output"], t["kwargs"]) for t in targets]
+            try:
+                results = batch["compiler_fn"](jobs, release=release)
+            except StaticCompilerError as e:
+                # Fails every target, rather than running the batch again for each
+                results = [e] * len(targets)
+            batch["results"] = {id(t): r for t, r in zip(targets, results)}
 
-def compile_target(target, makefilepath, release):
+    result = batch["results"][id(target)]
+    if isinstance(result, StaticCompilerError):
+        raise result
+    return result
+
+
+def compile_target(target, makefilepath, release, compile_fn=None, key=None):
+    """
+    Compiles ``target``, or restores it from the build cache. ``key`` is the
+    target's build cache key, if already found in the cache. ``compile_fn``
+    replaces the call to the target's ``compiler_fn`` for targets already
+    known not to be in the cache, eg. for batches.
+    """
     try:
         logv("\nCompiling: {}".format(target["output"]))
-        compiler_fn = target["compiler_fn"]
-        compiler_fn(target["input"], target["output"], release=release, **target["kwargs"])
-        load_dependencies_for_target(target, makefilepath)
+
+        if key is None and compile_fn is None and settings.BUILD_CACHE:
+            key = buildcache.artifact_key(target, makefilepath, release)
+        if key and buildcache.restore(key, target, makefilepath):
+            logv("Restored from build cache: {}", target["output"])
+        else:
+            if compile_fn is None:
+                compile_fn = functools.partial(
+                    target["compiler_fn"],
+                    target["input"],
+                    target["output"],
+                    release=release,
+                    **target["kwargs"],
+                )
+            try:
+                with profiler.span("compile " + target["output"], "compile", target["output"]):
+                    deps = compile_fn()
+            finally:
+                statcache.invalidate(graph.target_outputs(target), recursive=True)
+
+            # Some compilers find the dependencies while compiling
+            if target.get("dependencies_from_compiler") and deps is not None:
+                target["dependencies"] = [makefilepath] + deps
+            else:
+                load_dependencies_for_target(target, makefilepath)
+            if settings.BUILD_CACHE and "dependencies" in target:
+                buildcache.store(target, makefilepath, release)
+
+        if settings.CONTENT_HASH and "dependencies" in target:
+            target["fingerprints"] = fingerprint.fingerprint_files(target["dependencies"])
         return True
     except StaticCompilerError as e:
         log(str(e))
@@ -0,0 +1,155 @@
+import os
+import json
+import types
+import sqlite3
+import hashlib
+import threading
+from .modules.utils import logv, ensure_deleted
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS targets (
+    output TEXT PRIMARY KEY,
+    config TEXT NOT NULL,
+    dependencies TEXT NOT NULL,
+    fingerprints TEXT
+)
+"""
+
+_lock = threading.Lock()
+_connections = {}
+
+
+def cache_path(makefilepath):
+    return makefilepath + ".depscache.db"
+
+
+def _update_code_hash(h, code):
+    h.update(code.co_code)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _update_code_hash(h, const)
+        else:
+            h.update(repr(const).encode("utf-8"))
+
+
+def _describe(value):
+    if callable(value):
+        desc = "{}.{}".format(
+            getattr(value, "__module__", ""), getattr(value, "__qualname__", repr(value))
+        )
+        code = getattr(value, "__code__", None)
+        if code is not None:
+            h = hashlib.sha1()
+            _update_code_hash(h, code)
+            desc += ":" + h.hexdigest()
+        return desc
+    return repr(value)
+
+
+def target_config_hash(target):
+    """
+    Returns a hash of everything that defines a target in the makefile,
+    so cached dependencies are only reused for an identical target.
+    """
+    config = {
+        "compiler": target["compiler_fn"],
+        "input": target["input"],
+        "output": target["output"],
+        "kwargs": target["kwargs"],
+    }
+    data = json.dumps(config, sort_keys=True, default=_describe)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def _target_key(target):
+    return os.path.normpath(target["output"])
+
+
+def _connect(makefilepath):
+    path = cache_path(makefilepath)
+    conn = _connections.get(path)
+    if conn is not None:
+        return conn
+
+    # Remove the JSON cache used by previous versions
+    ensure_deleted(makefilepath + ".depscache")
+
+    for retry in (True, False):
+        try:
+            conn = sqlite3.connect(path, check_same_thread=False)
+            conn.execute(SCHEMA)
+            conn.commit()
+            break
+        except sqlite3.DatabaseError as e:
+            if conn is not None:
+                conn.close()
+                conn = None
+            if not retry:
+                logv("\nUnable to open dependencies cache {}: {}", path, e)
+                return None
+            ensure_deleted(path)
+
+    _connections[path] = conn
+    return conn
+
+
+def load(targets, makefilepath):
+    """
+    Restores the cached dependencies (and fingerprints) for all targets
+    whose configuration is unchanged since they were last compiled.
+    """
+    with _lock:
+        conn = _connect(makefilepath)
+        if conn is None:
+            return
+
+        try:
+            rows = conn.execute(
+                "SELECT output, config, dependencies, fingerprints FROM targets"
+            ).fetchall()
+        except sqlite3.DatabaseError as e:
+            logv("\nUnable to read dependencies cache: {}", e)
+            return
+
+    cache = {row[0]: row[1:] for row in rows}
+
+    for target in targets:
+        entry = cache.get(_target_key(target))
+        if not entry or entry[0] != target_config_hash(target):
+            continue
+
+        target["dependencies"] = json.loads(entry[1])
+        if entry[2] is not None:
+            target["fingerprints"] = json.loads(entry[2])
+
+
+def save(target, makefilepath):
+    """
+    Writes the dependencies (and fingerprints) of a single target to the cache.
+    """
+    if "dependencies" not in target:
+        return
+
+    fingerprints = target.get("fingerprints")
+    row = (
+        _target_key(target),
+        target_config_hash(target),
+        json.dumps(target["dependencies"]),
+        json.dumps(fingerprints) if fingerprints is not None else None,
+    )
+
+    with _lock:
+        conn = _connect(makefilepath)
+        if conn is None:
+            return
+
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO targets "
+                    "(output, config, dependencies, fingerprints) VALUES (?, ?, ?, ?)",
+                    row,
+                )
+        except sqlite3.DatabaseError as e:
+            logv("\nUnable to write dependencies cache: {}", e)
@@ -0,0 +1,91 @@
+import os
+import mmap
+import hashlib
+from . import statcache
+
+
+# Files at least this big are hashed through a memory map, smaller ones are streamed
+MMAP_THRESHOLD = 4 * 1024 * 1024
+CHUNK_SIZE = 256 * 1024
+
+
+def file_digest(path):
+    """
+    Returns a hex digest of the contents of ``path``. For a directory,
+    the digest covers the sorted list of entry names instead.
+    """
+    h = hashlib.sha1()
+
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            h.update(name.encode("utf-8", "surrogateescape") + b"\0")
+        return h.hexdigest()
+
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                h.update(m)
+        else:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                h.update(chunk)
+
+    return h.hexdigest()
+
+
+def fingerprint(path, previous=None):
+    """
+    Returns the ``[size, mtime_ns, digest]`` fingerprint for ``path``, or
+    ``None`` if it doesn't exist. If the size and modification time match
+    the ``previous`` fingerprint its digest is reused without reading the file.
+    """
+    st = statcache.stat(path)
+    if st is None:
+        return None
+
+    if previous and previous[0] == st.st_size and previous[1] == st.st_mtime_ns:
+        return previous
+
+    try:
+        return [st.st_size, st.st_mtime_ns, file_digest(path)]
+    except OSError:
+        return None
+
+
+def fingerprint_files(paths):
+    """
+    Returns a dict mapping each existing path in ``paths`` to its fingerprint.
+    """
+    result = {}
+    for path in paths:
+        fp = fingerprint(path)
+        if fp:
+            result[path] = fp
+    return result
+
+
+def files_are_unchanged(paths, fingerprints):
+    """
+    Checks whether the contents of all ``paths`` still match the digests
+    recorded in ``fingerprints``. Fingerprints of files that were touched
+    but not modified are updated in place, so they're cheap to check again.
+
+    :returns: A tuple ``(unchanged, refreshed)``, where ``refreshed`` is
+        ``True`` if any fingerprints were updated.
+    """
+    refreshed = False
+
+    for path in paths:
+        previous = fingerprints.get(path)
+        if not previous:
+            return (False, refreshed)
+
+        current = fingerprint(path, previous)
+        if not current or current[2] != previous[2]:
+            return (False, refreshed)
+
+        if current is not previous:
+            fingerprints[path] = current
+            refreshed = True
+
+    return (True, refreshed)
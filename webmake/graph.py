@@ -0,0 +1,108 @@
+import os
+
+
+def target_inputs(target):
+    """
+    Returns the absolute paths of a target's inputs and any known dependencies.
+    """
+    inputs = target["input"] if isinstance(target["input"], (list, tuple)) else [target["input"]]
+    paths = list(inputs) + target.get("dependencies", [])
+    return set(os.path.abspath(p) for p in paths if isinstance(p, str))
+
+
+def target_outputs(target):
+    """
+    Returns the absolute paths of the files (or directories) a target creates.
+    """
+    outputs = [target["output"]] + target.get("extra_outputs", [])
+    return [os.path.abspath(p) for p in outputs]
+
+
+def build_graph(targets):
+    """
+    Builds the dependency graph between targets, by matching each target's
+    outputs against the inputs and dependencies of all other targets.
+    A path inside a directory output (eg. from ``copy_files``) also counts.
+
+    :returns: A list containing, for each target, the sorted indexes of
+        the targets it depends on.
+    """
+    producers = {}
+    for i, target in enumerate(targets):
+        for output in target_outputs(target):
+            producers.setdefault(output, []).append(i)
+
+    predecessors = []
+    for i, target in enumerate(targets):
+        preds = set()
+        for path in target_inputs(target):
+            while True:
+                preds.update(producers.get(path, ()))
+                parent = os.path.dirname(path)
+                if parent == path:
+                    break
+                path = parent
+        preds.discard(i)
+        predecessors.append(sorted(preds))
+
+    return predecessors
+
+
+def find_cycle(predecessors):
+    """
+    :returns: A list of target indexes forming a dependency cycle,
+        or ``None`` if the graph is acyclic.
+    """
+    visiting, visited = set(), set()
+
+    def visit(i, path):
+        visiting.add(i)
+        path.append(i)
+        for p in predecessors[i]:
+            if p in visiting:
+                return path[path.index(p) :] + [p]
+            if p not in visited:
+                cycle = visit(p, path)
+                if cycle:
+                    return cycle
+        path.pop()
+        visiting.discard(i)
+        visited.add(i)
+        return None
+
+    for i in range(len(predecessors)):
+        if i not in visited:
+            cycle = visit(i, [])
+            if cycle:
+                return cycle
+
+    return None
+
+
+def ancestors(predecessors, indexes):
+    """
+    :returns: The set of targets which any of ``indexes`` directly or
+        indirectly depend on (not including ``indexes`` themselves).
+    """
+    result = set()
+    queue = list(indexes)
+    while queue:
+        for p in predecessors[queue.pop()]:
+            if p not in result:
+                result.add(p)
+                queue.append(p)
+
+    return result - set(indexes)
+
+
+def descendants(predecessors, indexes):
+    """
+    :returns: The set of targets which directly or indirectly depend on
+        any of ``indexes`` (not including ``indexes`` themselves).
+    """
+    dependents = [[] for _ in predecessors]
+    for i, preds in enumerate(predecessors):
+        for p in preds:
+            dependents[p].append(i)
+
+    return ancestors(dependents, indexes)
@@ -0,0 +1,156 @@
+// Browserify transform which wraps babelify with an on-disk cache of the
+// transformed source of each file, so unchanged files aren't run through
+// babel again on a cold build.
+//
+// Usage: browserify -t [ babelify-cached.js --babelify path/to/babelify
+//            --cacheDir dir --key versions --presets [ ... ] ] ...
+//
+// Entries are keyed by the file's path and contents, the contents of the
+// babel config files which apply to it (.babelrc, babel.config.* etc), the
+// ``key`` option (the babel module versions), the debug flag and
+// NODE_ENV/BABEL_ENV. All other options are passed on to babelify. Cached
+// files are touched when used, so webmake can evict the least recently used.
+"use strict";
+
+var fs = require("fs");
+var path = require("path");
+var crypto = require("crypto");
+var Transform = require("stream").Transform;
+
+var EXTENSIONS = /\.(jsx?|es6?|mjs)$/;
+
+// Babel options which change which config files are loaded
+var CONFIG_OPTIONS = ["cwd", "root", "rootMode", "configFile", "babelrc", "babelrcRoots", "envName"];
+
+function writeFileAtomic(file, contents) {
+    fs.mkdirSync(path.dirname(file), { recursive: true });
+    var tmp = file + ".tmp" + process.pid;
+    fs.writeFileSync(tmp, contents);
+    fs.renameSync(tmp, file);
+}
+
+// Contents of config files by path, reread when their mtime changes
+var configContents = {};
+
+function readConfig(file) {
+    var mtime = fs.statSync(file).mtimeMs;
+    var cached = configContents[file];
+    if (!cached || cached.mtime !== mtime) {
+        cached = configContents[file] = { mtime: mtime, contents: fs.readFileSync(file, "utf8") };
+    }
+    return cached.contents;
+}
+
+// The contents of the babel config files which apply to ``file``, or null
+// if they can't be loaded (babelify then reports the error).
+function babelConfigs(babelify, file, babelOpts) {
+    try {
+        var babel = require(require.resolve("@babel/core", { paths: [babelify] }));
+        var configOpts = { filename: file };
+        CONFIG_OPTIONS.forEach(function (name) {
+            if (name in babelOpts) {
+                configOpts[name] = babelOpts[name];
+            }
+        });
+        var config = babel.loadPartialConfig(configOpts);
+        if (!config) {
+            return [];
+        }
+        return [config.config, config.babelrc].map(function (f) {
+            return f ? [f, readConfig(f)] : null;
+        });
+    } catch (e) {
+        return null;
+    }
+}
+
+module.exports = function (file, opts) {
+    var babelify = require(opts.babelify);
+    var babelOpts = Object.assign({}, opts);
+    delete babelOpts.babelify;
+    delete babelOpts.cacheDir;
+    delete babelOpts.key;
+
+    if (!EXTENSIONS.test(file)) {
+        return babelify(file, babelOpts);
+    }
+
+    var chunks = [];
+
+    return new Transform({
+        transform: function (chunk, enc, next) {
+            chunks.push(Buffer.from(chunk));
+            next();
+        },
+        flush: function (done) {
+            var self = this;
+            var source = Buffer.concat(chunks);
+            var configs = babelConfigs(opts.babelify, file, babelOpts);
+
+            if (configs === null) {
+                var uncached = babelify(file, babelOpts);
+                uncached.on("data", function (chunk) {
+                    self.push(chunk);
+                });
+                uncached.on("error", done);
+                uncached.on("end", function () {
+                    done();
+                });
+                uncached.end(source);
+                return;
+            }
+
+            var hash = crypto.createHash("sha1");
+            hash.update(
+                JSON.stringify([
+                    opts.key,
+                    !!(opts._flags && opts._flags.debug),
+                    process.env.NODE_ENV || "",
+                    process.env.BABEL_ENV || "",
+                    file,
+                    configs,
+                ])
+            );
+            hash.update(source);
+            var digest = hash.digest("hex");
+            var cached = path.join(opts.cacheDir, digest.slice(0, 2), digest + ".js");
+
+            var result = null;
+            try {
+                result = fs.readFileSync(cached);
+            } catch (e) {
+                // Not cached yet
+            }
+
+            if (result !== null) {
+                try {
+                    var now = new Date();
+                    fs.utimesSync(cached, now, now);
+                } catch (e) {
+                    // Only used for eviction
+                }
+                self.push(result);
+                done();
+                return;
+            }
+
+            var output = [];
+            var t = babelify(file, babelOpts);
+            t.on("data", function (chunk) {
+                output.push(Buffer.from(chunk));
+            });
+            t.on("error", done);
+            t.on("end", function () {
+                result = Buffer.concat(output);
+                try {
+                    writeFileAtomic(cached, result);
+                } catch (e) {
+                    // The cache is only an optimization
+                }
+                self.push(result);
+                done();
+            });
+            t.end(source);
+        },
+    });
+};
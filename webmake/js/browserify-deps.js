@@ -0,0 +1,33 @@
+// Browserify plugin which writes the path of every file included in the
+// bundle to a sidecar file (one per line), so dependencies are collected
+// during the compile itself rather than by a separate `browserify --list`.
+//
+// Usage: browserify -p [ browserify-deps.js --output deps.txt ] ...
+"use strict";
+
+var fs = require("fs");
+var Transform = require("stream").Transform;
+
+module.exports = function (b, opts) {
+    var output = opts.output;
+
+    function collect() {
+        var files = [];
+
+        b.pipeline.get("deps").push(
+            new Transform({
+                objectMode: true,
+                transform: function (row, enc, next) {
+                    files.push(row.file || row.id);
+                    next(null, row);
+                },
+                flush: function (done) {
+                    fs.writeFile(output, files.join("\n"), done);
+                },
+            })
+        );
+    }
+
+    collect();
+    b.on("reset", collect);
+};
@@ -0,0 +1,17 @@
+// Browserify plugin which requires every module listed in a JSON manifest
+// file, exposed under its given name. Used instead of a `-r file:name`
+// argument per module, which can exceed the command line length limit.
+//
+// Usage: browserify -p [ browserify-manifest.js --manifest libs.json ] ...
+//
+// The manifest is a list of {"file": "...", "expose": "..."} objects. Any
+// other options (eg. a digest of the manifest) are ignored.
+"use strict";
+
+var fs = require("fs");
+
+module.exports = function (b, opts) {
+    JSON.parse(fs.readFileSync(opts.manifest, "utf8")).forEach(function (m) {
+        b.require(m.file, { expose: m.expose });
+    });
+};
@@ -0,0 +1,58 @@
+// Live reload client for `webmake -w --livereload`. Include it in pages
+// during development with:
+//
+//   <script src="http://localhost:35729/livereload.js"></script>
+//
+// Changed stylesheets are swapped in place, any other change reloads the page.
+(function () {
+    "use strict";
+
+    var origin = new URL(document.currentScript.src).origin;
+    var source = new EventSource(origin + "/events");
+
+    function basename(path) {
+        return path.split("/").pop();
+    }
+
+    function isStylesheet(path) {
+        return /\.css$/.test(path);
+    }
+
+    function reloadStylesheets(paths) {
+        var names = paths.map(basename);
+        var links = Array.prototype.slice.call(document.querySelectorAll('link[rel="stylesheet"]'));
+        var matching = links.filter(function (link) {
+            return names.indexOf(basename(new URL(link.href).pathname)) >= 0;
+        });
+
+        // Output paths don't always match URLs, so if none match reload them all
+        (matching.length ? matching : links).forEach(function (link) {
+            var url = new URL(link.href);
+            url.searchParams.set("livereload", Date.now());
+
+            // Remove the old stylesheet once the new one loads, to avoid a flash of unstyled content
+            var replacement = link.cloneNode();
+            replacement.href = url.href;
+            replacement.onload = replacement.onerror = function () {
+                link.remove();
+            };
+            link.after(replacement);
+        });
+    }
+
+    source.onmessage = function (event) {
+        var paths = JSON.parse(event.data).paths.filter(function (path) {
+            return !/\.map$/.test(path);
+        });
+
+        if (!paths.length) {
+            return;
+        }
+
+        if (paths.every(isStylesheet)) {
+            reloadStylesheets(paths);
+        } else {
+            location.reload();
+        }
+    };
+})();
@@ -0,0 +1,309 @@
+// Long-lived worker which loads webmake's node tools once and runs jobs
+// sent from Python, to avoid starting node and reloading a tool from
+// node_modules for every compile.
+//
+// Protocol: one JSON object per line on stdin and stdout.
+//   Request:  {"id": 1, "tool": "less", "args": {...}}
+//   Response: {"id": 1, "result": {...}}
+//         or  {"id": 1, "error": {"message": "...", "output": "..."}}
+"use strict";
+
+var fs = require("fs");
+var path = require("path");
+var readline = require("readline");
+var url = require("url");
+var Transform = require("stream").Transform;
+
+// Keep stdout clean for responses
+console.log = console.info = console.warn = console.error;
+
+function writeFileAtomic(file, contents) {
+    fs.mkdirSync(path.dirname(path.resolve(file)), { recursive: true });
+    var tmp = file + ".tmp" + process.pid;
+    fs.writeFileSync(tmp, contents);
+    fs.renameSync(tmp, file);
+}
+
+// Persistent browserify instances and their module caches, by key
+var bundlers = {};
+
+function createBundler(argv, cache, packageCache) {
+    var b = require("browserify/bin/args")(argv, { cache: cache, packageCache: packageCache });
+    var bundler = { b: b, argv: JSON.stringify(argv), cache: cache, packageCache: packageCache };
+
+    // Record every module in the cache after transforms, like watchify
+    function collect() {
+        bundler.files = [];
+        b.pipeline.get("deps").push(
+            new Transform({
+                objectMode: true,
+                transform: function (row, enc, next) {
+                    var file = row.expose ? b._expose[row.id] : row.file;
+                    cache[file] = { source: row.source, deps: Object.assign({}, row.deps) };
+                    bundler.files.push(row.file || row.id);
+                    next(null, row);
+                },
+            })
+        );
+    }
+
+    collect();
+    b.on("reset", collect);
+    return bundler;
+}
+
+// Less plugin sharing the contents of imported files between compiles
+function cachingFileManager(less) {
+    var contents = {};
+
+    function CachingFileManager() {}
+    CachingFileManager.prototype = new less.FileManager();
+    CachingFileManager.prototype.loadFile = function (filename, currentDirectory, options) {
+        var key = JSON.stringify([filename, currentDirectory, options.paths]);
+        if (!contents[key]) {
+            contents[key] = less.FileManager.prototype.loadFile.apply(this, arguments);
+            contents[key].catch(function () {
+                delete contents[key];
+            });
+        }
+        return contents[key];
+    };
+
+    return {
+        install: function (less, pluginManager) {
+            pluginManager.addFileManager(new CachingFileManager());
+        },
+    };
+}
+
+function compileLess(args, plugins) {
+    var less = require("less");
+    var input = path.resolve(args.input);
+    var options = { filename: input, compress: !!args.compress, plugins: plugins || [] };
+
+    if (args.sourceMap) {
+        options.sourceMap = {
+            sourceMapURL: path.basename(args.sourceMap),
+            sourceMapOutputFilename: path.basename(args.output),
+            sourceMapBasepath: path.dirname(input),
+            sourceMapRootpath: path.relative(
+                path.dirname(path.resolve(args.sourceMap)),
+                path.dirname(input)
+            ),
+        };
+    }
+
+    return less.render(fs.readFileSync(input, "utf8"), options).then(
+        function (result) {
+            writeFileAtomic(args.output, result.css);
+            if (args.sourceMap && result.map) {
+                writeFileAtomic(args.sourceMap, result.map);
+            }
+            return { imports: result.imports };
+        },
+        function (err) {
+            var where = err.filename ? " in " + err.filename + " on line " + err.line : "";
+            var e = new Error(err.message + where);
+            e.output = (err.extract || []).filter(Boolean).join("\n");
+            throw e;
+        }
+    );
+}
+
+var tools = {
+    less: function (args) {
+        return compileLess(args);
+    },
+
+    "less-batch": function (args) {
+        var plugins = [cachingFileManager(require("less"))];
+        var results = [];
+
+        return args.jobs
+            .reduce(function (previous, job) {
+                return previous.then(function () {
+                    return compileLess(job, plugins).then(
+                        function (result) {
+                            results.push(result);
+                        },
+                        function (err) {
+                            results.push({
+                                error: {
+                                    message: String(err.message || err),
+                                    output: err.output || "",
+                                },
+                            });
+                        }
+                    );
+                });
+            }, Promise.resolve())
+            .then(function () {
+                return { results: results };
+            });
+    },
+
+    sass: function (args) {
+        var sass = require("sass");
+        var result = sass.compile(path.resolve(args.input), {
+            style: args.style,
+            sourceMap: !!args.sourceMap,
+            // Like the CLI's --quiet, rather than printing warnings to our stderr
+            logger: sass.Logger.silent,
+            quietDeps: true,
+        });
+        var css = result.css;
+
+        if (args.sourceMap && result.sourceMap) {
+            // Like the CLI, list sources relative to the map file
+            var map = result.sourceMap;
+            var mapDir = path.dirname(path.resolve(args.sourceMap));
+            map.file = path.basename(args.output);
+            map.sources = map.sources.map(function (source) {
+                if (!source.startsWith("file:")) {
+                    return source;
+                }
+                var file = path.relative(mapDir, url.fileURLToPath(source));
+                return file.split(path.sep).join("/");
+            });
+            writeFileAtomic(args.sourceMap, JSON.stringify(map));
+            css += "\n\n/*# sourceMappingURL=" + path.basename(args.sourceMap) + " */\n";
+        }
+
+        writeFileAtomic(args.output, css);
+
+        var loaded = result.loadedUrls.filter(function (u) {
+            return u.protocol === "file:";
+        });
+        return { dependencies: loaded.map(url.fileURLToPath) };
+    },
+
+    browserify: function (args) {
+        var bundler = args.persistent ? bundlers[args.key] : null;
+        if (!bundler || bundler.argv !== JSON.stringify(args.argv)) {
+            bundler = createBundler(args.argv, {}, {});
+        }
+        if (!args.persistent) {
+            delete bundlers[args.key];
+        }
+
+        args.invalidate.forEach(function (file) {
+            delete bundler.cache[file];
+            delete bundler.packageCache[file];
+        });
+
+        if (args.persistent) {
+            bundlers[args.key] = bundler;
+        }
+
+        return new Promise(function (resolve, reject) {
+            var chunks = [];
+            var stream = bundler.b.bundle();
+            stream.on("data", function (chunk) {
+                chunks.push(chunk);
+            });
+            stream.on("error", function (err) {
+                // Start a fresh instance next time, but keep the module cache
+                if (bundlers[args.key] === bundler) {
+                    bundlers[args.key] = createBundler(
+                        args.argv,
+                        bundler.cache,
+                        bundler.packageCache
+                    );
+                }
+                reject(err);
+            });
+            stream.on("end", function () {
+                var code = Buffer.concat(chunks);
+                if (args.minify) {
+                    var result = require("uglify-js").minify(code.toString("utf8"), {
+                        compress: {},
+                        mangle: true,
+                    });
+                    if (result.error) {
+                        reject(result.error);
+                        return;
+                    }
+                    code = result.code;
+                }
+                writeFileAtomic(args.output, code);
+                resolve({ dependencies: bundler.files });
+            });
+        });
+    },
+
+    "uglify-js": function (args) {
+        var UglifyJS = require("uglify-js");
+        var files = {};
+        args.inputs.forEach(function (f) {
+            files[f] = fs.readFileSync(f, "utf8");
+        });
+
+        var result = UglifyJS.minify(files, { compress: {}, mangle: true });
+        if (result.error) {
+            throw result.error;
+        }
+        writeFileAtomic(args.output, result.code);
+        return {};
+    },
+
+    "clean-css": function (args) {
+        var CleanCSS = require("clean-css");
+        var result = new CleanCSS({}).minify(fs.readFileSync(args.input, "utf8"));
+        if (result.errors.length) {
+            throw new Error(result.errors.join("\n"));
+        }
+        writeFileAtomic(args.output, result.styles);
+        return {};
+    },
+};
+
+function respond(response) {
+    process.stdout.write(JSON.stringify(response) + "\n");
+}
+
+// Sets environment variables for the duration of a job, and returns a
+// function restoring the previous values. Python sends one job at a time.
+function applyEnv(env) {
+    var previous = {};
+    Object.keys(env || {}).forEach(function (name) {
+        previous[name] = process.env[name];
+        process.env[name] = env[name];
+    });
+
+    return function () {
+        Object.keys(previous).forEach(function (name) {
+            if (previous[name] === undefined) {
+                delete process.env[name];
+            } else {
+                process.env[name] = previous[name];
+            }
+        });
+    };
+}
+
+readline.createInterface({ input: process.stdin }).on("line", function (line) {
+    var request = JSON.parse(line);
+    var restoreEnv = applyEnv(request.args.env);
+
+    Promise.resolve()
+        .then(function () {
+            var tool = tools[request.tool];
+            if (!tool) {
+                throw new Error("Unknown tool: " + request.tool);
+            }
+            return tool(request.args);
+        })
+        .then(
+            function (result) {
+                restoreEnv();
+                respond({ id: request.id, result: result || {} });
+            },
+            function (err) {
+                restoreEnv();
+                respond({
+                    id: request.id,
+                    error: { message: String(err.message || err), output: err.output || "" },
+                });
+            }
+        );
+});
@@ -0,0 +1,103 @@
+"""
+Live reload server for watch mode. Pages include ``/livereload.js``, which
+listens for changed output files on the ``/events`` server-sent events
+stream, swapping stylesheets in place and reloading the page otherwise.
+"""
+
+import json
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .modules import utils
+
+
+DEFAULT_PORT = 35729
+KEEPALIVE_INTERVAL = 15
+
+_lock = threading.Lock()
+_clients = set()
+
+
+class LiveReloadHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/livereload.js":
+            self.send_script()
+        elif path == "/events":
+            self.send_events()
+        else:
+            self.send_error(404)
+
+    def send_script(self):
+        with open(utils.get_js_path("livereload.js"), "rb") as f:
+            script = f.read()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/javascript")
+        self.send_header("Content-Length", str(len(script)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(script)
+
+    def send_events(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+
+        client = queue.Queue()
+        with _lock:
+            _clients.add(client)
+
+        try:
+            self.wfile.write(b"retry: 1000\n\n")
+            self.wfile.flush()
+            while True:
+                try:
+                    message = b"data: " + client.get(timeout=KEEPALIVE_INTERVAL) + b"\n\n"
+                except queue.Empty:
+                    message = b": keepalive\n\n"
+                self.wfile.write(message)
+                self.wfile.flush()
+        except OSError:
+            pass
+        finally:
+            with _lock:
+                _clients.discard(client)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        # Keep the watcher's output readable
+        pass
+
+
+def start(port=DEFAULT_PORT):
+    """
+    Starts the live reload server on a background thread.
+
+    :returns: The server, or ``None`` if it couldn't listen on ``port``.
+    """
+    try:
+        server = ThreadingHTTPServer(("127.0.0.1", port), LiveReloadHandler)
+    except OSError as e:
+        utils.log("\nERROR: Unable to start live reload server on port {}: {}", port, e)
+        return None
+
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    utils.log(
+        '\nLive reload enabled, add <script src="http://localhost:{}/livereload.js"></script> '
+        "to your pages.",
+        port,
+    )
+    return server
+
+
+def notify(paths):
+    """
+    Tells all connected pages that the output files ``paths`` changed.
+    """
+    data = json.dumps({"paths": [utils.relative_path(p).replace("\\", "/") for p in paths]})
+    with _lock:
+        for client in _clients:
+            client.put(data.encode("utf-8"))
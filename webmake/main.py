@@ -5,7 +5,7 @@ import importlib
 import functools
 import traceback
 from .modules import utils
-from . import settings, compiler, watcher
+from . import settings, compiler, watcher, profiler, livereload
 
 
 def command_line_error(parser, makefile, message):
@@ -43,18 +43,90 @@ def parse_command_line():
         action="store_true",
         help="Force recompilation of all source files, even if not modified.",
     )
+    parser.add_argument(
+        "-b",
+        "--build-cache",
+        action="store_true",
+        help="Restore outputs compiled before from identical inputs, instead of recompiling.",
+    )
+    parser.add_argument(
+        "--build-cache-size",
+        type=int,
+        default=settings.BUILD_CACHE_SIZE // (1024 * 1024),
+        metavar="MB",
+        help="Maximum size of the build cache (default %(default)sMB).",
+    )
+    parser.add_argument(
+        "--remote-cache",
+        metavar="URL",
+        help="Base URL of a shared HTTP build cache to GET and PUT artifacts. "
+        "Implies --build-cache.",
+    )
+    parser.add_argument(
+        "--remote-cache-readonly",
+        action="store_true",
+        help="Only download from the remote build cache, never upload.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Directory for webmake's caches (default webmakefile.py.cache).",
+    )
+    parser.add_argument(
+        "-c",
+        "--content-hash",
+        action="store_true",
+        help="Only recompile when the contents of dependencies change, not their timestamps.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of targets to compile in parallel (default 1).",
+    )
+    parser.add_argument(
+        "-k",
+        "--keep-going",
+        action="store_true",
+        help="Keep compiling targets that don't depend on a failed one, and summarize failures.",
+    )
     parser.add_argument(
         "-m",
         "--makefile",
         default=default_webmakefile,
         help="Specify the webmakefile.py to use for compilation settings.",
     )
+    parser.add_argument(
+        "--no-node-worker",
+        action="store_true",
+        help="Start the node command line tools for every compile, instead of "
+        "using persistent node workers.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print a timing report per target and phase, and write a Chrome trace "
+        "to webmakefile.py.trace.json.",
+    )
     parser.add_argument(
         "-w",
         "--watch",
         action="store_true",
         help="Watch all input files for changes, and recompile automatically.",
     )
+    parser.add_argument(
+        "--livereload",
+        action="store_true",
+        help="In watch mode, serve a live reload script which swaps changed stylesheets "
+        "in place and reloads the page for other changes.",
+    )
+    parser.add_argument(
+        "--livereload-port",
+        type=int,
+        default=livereload.DEFAULT_PORT,
+        metavar="PORT",
+        help="Port for the live reload server (default %(default)s).",
+    )
     parser.add_argument(
         "-p",
         "--polling-watcher",
@@ -62,6 +134,14 @@ def parse_command_line():
         help="Use the polling watcher instead of inotify (increased compatibility).",
     )
 
+    parser.add_argument(
+        "targets",
+        nargs="*",
+        metavar="TARGET",
+        help="Output paths or glob patterns of the targets to build (default all). "
+        "Targets they depend on are also built.",
+    )
+
     args = parser.parse_args()
     error_fn = functools.partial(command_line_error, parser, args.makefile)
 
@@ -71,6 +151,12 @@ def parse_command_line():
             "your project root and run from there."
         )
 
+    if args.jobs < 1:
+        error_fn("--jobs must be at least 1.")
+
+    if args.livereload and not args.watch:
+        error_fn("--livereload requires --watch.")
+
     return (args, error_fn)
 
 
@@ -79,7 +165,18 @@ def main():
     settings.VERBOSE = args.verbose
     settings.RELEASE = args.release
     settings.FORCE = args.force
+    settings.CONTENT_HASH = args.content_hash
+    settings.JOBS = args.jobs
+    settings.KEEP_GOING = args.keep_going
+    settings.PROFILE = args.profile
+    settings.NODE_WORKER = not args.no_node_worker
+    settings.BUILD_CACHE = args.build_cache or bool(args.remote_cache)
+    settings.REMOTE_CACHE_URL = args.remote_cache
+    settings.REMOTE_CACHE_WRITE = not args.remote_cache_readonly
+    settings.BUILD_CACHE_SIZE = args.build_cache_size * 1024 * 1024
     settings.MAKEFILEPATH = args.makefile
+    settings.TARGET_PATTERNS = [os.path.abspath(p) for p in args.targets]
+    settings.CACHE_DIR = os.path.abspath(args.cache_dir or args.makefile + ".cache")
 
     webmakefile_dir = os.path.abspath(os.path.expanduser(os.path.dirname(args.makefile)))
     webmakefile_name = os.path.basename(args.makefile)
@@ -89,7 +186,8 @@ def main():
     sys.path.insert(0, webmakefile_dir)
 
     try:
-        makefile = importlib.import_module(webmakefile_module)
+        with profiler.span("import " + webmakefile_name, "makefile"):
+            makefile = importlib.import_module(webmakefile_module)
     except RuntimeError as e:
         error_fn(str(e))
     except Exception as e:  # pylint: disable=broad-except
@@ -103,10 +201,21 @@ def main():
     utils.logv("WEBMAKEFILE = {}", os.path.join(webmakefile_dir, webmakefile_name))
     utils.logv("RELEASE MODE = {}", ("On" if settings.RELEASE else "Off"))
     utils.logv("FORCE COMPILATION = {}", ("On" if settings.FORCE else "Off"))
+    utils.logv("CONTENT HASHING = {}", ("On" if settings.CONTENT_HASH else "Off"))
+    utils.logv("PARALLEL JOBS = {}", settings.JOBS)
+    utils.logv("KEEP GOING = {}", ("On" if settings.KEEP_GOING else "Off"))
+    utils.logv("BUILD CACHE = {}", (settings.CACHE_DIR if settings.BUILD_CACHE else "Off"))
+    utils.logv("REMOTE BUILD CACHE = {}", (settings.REMOTE_CACHE_URL or "Off"))
 
     # Load any cached dependencies
     compiler.load_dependencies_from_cache(settings.MAKEFILE, settings.MAKEFILEPATH)
 
+    if settings.TARGET_PATTERNS:
+        settings.MAKEFILE = compiler.select_targets(settings.MAKEFILE, settings.TARGET_PATTERNS)
+        if not settings.MAKEFILE:
+            error_fn("No targets match: {}".format(" ".join(args.targets)))
+        utils.logv("TARGETS = {}", " ".join(t["output"] for t in settings.MAKEFILE))
+
     if settings.FORCE:
         if not compiler.compile_all(settings.MAKEFILE, settings.MAKEFILEPATH, settings.RELEASE):
             sys.exit(1)
@@ -117,4 +226,7 @@ def main():
             sys.exit(1)
 
     if args.watch:
-        watcher.start_watching(use_polling_watcher=args.polling_watcher)
+        watcher.start_watching(
+            use_polling_watcher=args.polling_watcher,
+            livereload_port=args.livereload_port if args.livereload else None,
+        )
@@ -1,5 +1,61 @@
 import os
-from . import utils, minify
+import json
+import hashlib
+import tempfile
+import threading
+from . import utils, minify, nodeworker
+from .. import settings
+
+
+BABEL_MODULES = ["babelify", "@babel/core", "@babel/preset-env", "@babel/preset-react"]
+
+_babel_cache_key = None
+_evict_lock = threading.Lock()
+
+
+def get_babel_cache_key():
+    """
+    Returns the versions of the babel modules, which are part of the key
+    of every entry in the transform cache.
+    """
+    global _babel_cache_key
+    if _babel_cache_key is None:
+        versions = [[m, utils.get_node_module_version(m)] for m in BABEL_MODULES]
+        _babel_cache_key = hashlib.sha1(json.dumps(versions).encode("utf-8")).hexdigest()
+    return _babel_cache_key
+
+
+def evict_transforms(max_size):
+    """
+    Deletes the least recently used babel-transformed files until the
+    transform cache is no bigger than ``max_size`` bytes. Skipped if another
+    thread is already evicting.
+    """
+    if not _evict_lock.acquire(blocking=False):
+        return
+
+    try:
+        entries = []
+        try:
+            for prefix in os.scandir(utils.get_cache_dir("transforms")):
+                if not prefix.is_dir():
+                    continue
+                for entry in os.scandir(prefix.path):
+                    if entry.is_file() and ".tmp" not in entry.name:
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+
+        total = sum(e[1] for e in entries)
+        for _, size, path in sorted(entries):
+            if total <= max_size:
+                break
+            utils.logv("Evicting from transform cache: {}", os.path.basename(path))
+            utils.ensure_deleted(path)
+            total -= size
+    finally:
+        _evict_lock.release()
 
 
 def get_extensions_and_params(babelify=False):
@@ -11,7 +67,27 @@ def get_extensions_and_params(babelify=False):
         preset_env = utils.get_node_modules_dir("@babel/preset-env")
         preset_react = utils.get_node_modules_dir("@babel/preset-react")
         extensions.extend([".jsx"])
-        params.extend(["-t", "[", babelify, "--presets", "[", preset_env, preset_react, "]", "]"])
+
+        # Babelify through a wrapper caching the output for each file on disk
+        params.extend(
+            [
+                "-t",
+                "[",
+                utils.get_js_path("babelify-cached.js"),
+                "--babelify",
+                babelify,
+                "--cacheDir",
+                utils.get_cache_dir("transforms"),
+                "--key",
+                get_babel_cache_key(),
+                "--presets",
+                "[",
+                preset_env,
+                preset_react,
+                "]",
+                "]",
+            ]
+        )
 
     return (extensions, params)
 
@@ -49,26 +125,191 @@ def browserify_basic_command(output_file, release, list_deps):
     return cmdline
 
 
-def browserify_run(cmdline, errmsg, output_file, release, list_deps):
+def browserify_run(
+    cmdline, errmsg, output_file, release, list_deps, persistent=True, use_worker=True
+):
+    """
+    Runs browserify, and returns the list of files included in the bundle.
+    When compiling, the list is written to a sidecar file by a plugin, to
+    avoid a second ``browserify --list`` run. In release mode the bundle is
+    minified on its way to the output file, without writing it out first.
+    Without ``persistent``, watch mode bundles from scratch on each build,
+    and without ``use_worker`` it always runs the command line tool.
+    """
     env = {"NODE_ENV": "production"} if release else None
 
     try:
         if output_file:
             utils.ensure_path_exists(os.path.dirname(output_file))
 
-        output = utils.run_command(cmdline, errmsg, env=env)
         if list_deps:
-            return [os.path.abspath(p) if os.path.exists(p) else p for p in output.splitlines()]
-        elif release:
-            minify.minify_js([output_file], output_file, release=release)
+            files = utils.run_command(cmdline, errmsg, env=env).splitlines()
+        else:
+            files = None
+            if use_worker and (settings.WATCH or release):
+                files = browserify_run_worker(
+                    cmdline, errmsg, output_file, env, release, persistent=persistent
+                )
+            if files is None:
+                files = browserify_run_cli(cmdline, errmsg, output_file, env, release)
+            if utils.get_js_path("babelify-cached.js") in cmdline:
+                evict_transforms(settings.TRANSFORM_CACHE_SIZE)
+
+        return [os.path.abspath(p) if os.path.exists(p) else p for p in files]
     except:
         if output_file:
             utils.ensure_deleted(output_file)
         raise
 
 
+def strip_output_arg(cmdline):
+    """
+    Removes the node script and ``-o output_file`` from a browserify command line.
+    """
+    argv = [c for c in cmdline[1:] if c != ""]
+    i = argv.index("-o")
+    del argv[i : i + 2]
+    return argv
+
+
+def browserify_run_cli(cmdline, errmsg, output_file, env, release):
+    fd, deps_file = tempfile.mkstemp(prefix="webmake-", suffix=".deps")
+    os.close(fd)
+
+    try:
+        plugin = utils.get_js_path("browserify-deps.js")
+        plugin_args = ["-p", "[", plugin, "--output", deps_file, "]"]
+
+        if not release:
+            utils.run_command(cmdline + plugin_args, errmsg, env=env)
+        else:
+            # Pipe the bundle straight into uglifyjs, then move it into place
+            tmp_file = "{}.tmp{}".format(output_file, threading.get_ident())
+            uglify = [
+                utils.get_node_bin_path("uglify-js", "bin", "uglifyjs"),
+                "--compress",
+                "--mangle",
+                "-o",
+                tmp_file,
+            ]
+            try:
+                bundle = cmdline[:1] + strip_output_arg(cmdline) + plugin_args
+                utils.run_pipeline([bundle, uglify], errmsg, env=env)
+                os.replace(tmp_file, output_file)
+            finally:
+                utils.ensure_deleted(tmp_file)
+
+        with open(deps_file) as f:
+            return f.read().splitlines()
+    finally:
+        utils.ensure_deleted(deps_file)
+
+
+_invalidated_lock = threading.Lock()
+_invalidated = {}
+
+
+def invalidate_bundles(paths):
+    """
+    Marks ``paths`` as changed for every persistent bundler, so only those
+    modules are reloaded on their next build.
+    """
+    paths = [os.path.abspath(p) for p in paths]
+    with _invalidated_lock:
+        for files in _invalidated.values():
+            files.update(paths)
+
+
+def browserify_run_worker(cmdline, errmsg, output_file, env, release, persistent=True):
+    """
+    Bundles on a node worker, minifying the bundle in memory in release mode.
+
+    In watch mode the worker keeps a browserify instance and its module
+    cache for each output file, like ``watchify``, so a rebuild only
+    reloads and transforms the files that changed. Unless ``persistent``
+    is false, eg. when the changed files aren't all reported.
+
+    :returns: The bundled files, or ``None`` if no worker is available.
+    """
+    key = os.path.abspath(output_file)
+    persistent = persistent and settings.WATCH
+
+    invalidate = []
+    if persistent:
+        with _invalidated_lock:
+            invalidate = sorted(_invalidated.setdefault(key, set()))
+            _invalidated[key].clear()
+
+    result = nodeworker.run(
+        "browserify",
+        errmsg,
+        affinity=key if persistent else None,
+        key=key,
+        # The worker handles the output file itself
+        argv=strip_output_arg(cmdline),
+        output=output_file,
+        invalidate=invalidate,
+        persistent=persistent,
+        minify=bool(release),
+        env=env or {},
+    )
+
+    if result is None:
+        with _invalidated_lock:
+            _invalidated.pop(key, None)
+        return None
+
+    return result["dependencies"]
+
+
+def fix_node_modules_paths(paths):
+    """
+    Browserify lists some files in node_modules relative to it, and
+    sometimes lists invalid paths, so resolve or drop them.
+    """
+
+    def fix_node_modules_path(path):
+        if os.path.exists(path):
+            return path
+        newpath = os.path.abspath(os.path.join("node_modules", path))
+        if os.path.exists(newpath):
+            return newpath
+        return None
+
+    result = [fix_node_modules_path(p) for p in paths]
+    return [p for p in result if p]
+
+
+def lockfile_dependencies(module_list, files):
+    """
+    Replaces the ``node_modules`` files in ``files`` with the project's
+    package files and the ``package.json`` of each module in ``module_list``.
+    """
+    deps = [f for f in files if "node_modules" not in f.replace("\\", "/").split("/")]
+
+    for name in ("package.json", "package-lock.json", "npm-shrinkwrap.json"):
+        if os.path.exists(name):
+            deps.append(os.path.abspath(name))
+
+    for m in module_list:
+        if m.startswith("./"):
+            continue
+        parts = m.split("/")
+        package = "/".join(parts[:2] if m.startswith("@") else parts[:1])
+        path = os.path.abspath(os.path.join("node_modules", package, "package.json"))
+        if os.path.exists(path):
+            deps.append(path)
+
+    return deps
+
+
 def browserify_node_modules(
-    module_list, output_file=None, release=False, list_deps=False, babelify=False
+    module_list,
+    output_file=None,
+    release=False,
+    list_deps=False,
+    babelify=False,
+    track_by_lockfile=False,
 ):
     (_, params) = get_extensions_and_params(babelify=babelify)
     errmsg = browserify_basic_error("browserify_node_modules", output_file, list_deps)
@@ -83,22 +324,141 @@ def browserify_node_modules(
         else:
             cmdline.extend(["-r", m])
 
-    result = browserify_run(cmdline, errmsg, output_file, release, list_deps)
+    # Tracked by lockfile, the files in node_modules which changed aren't
+    # reported, so a persistent bundler would keep their old contents
+    result = fix_node_modules_paths(
+        browserify_run(
+            cmdline, errmsg, output_file, release, list_deps, persistent=not track_by_lockfile
+        )
+    )
+    if track_by_lockfile:
+        result = lockfile_dependencies(module_list, result)
+    return result
 
-    if list_deps:
 
-        def fix_node_modules_path(path):
-            if os.path.exists(path):
-                return path
-            newpath = os.path.abspath(os.path.join("node_modules", path))
-            if os.path.exists(newpath):
-                return newpath
-            return None
+_listings_lock = threading.Lock()
+_listings = None
+_listings_changed = False
 
-        result = [fix_node_modules_path(p) for p in result]
-        result = [p for p in result if p]
 
-    return result
+def _listings_path():
+    return os.path.join(utils.get_cache_dir("browserify"), "listings.json")
+
+
+def _get_listing(key):
+    global _listings
+    with _listings_lock:
+        if _listings is None:
+            try:
+                with open(_listings_path()) as f:
+                    _listings = json.load(f)
+            except (IOError, ValueError):
+                _listings = {}
+        return _listings.get(key)
+
+
+def _set_listing(key, listing):
+    global _listings_changed
+    with _listings_lock:
+        _listings[key] = listing
+        _listings_changed = True
+
+
+def save_lib_listings():
+    """
+    Saves the cached directory listings, so later runs only list the
+    directories which changed.
+    """
+    global _listings_changed
+    with _listings_lock:
+        if not _listings_changed:
+            return
+        data = json.dumps(_listings)
+        _listings_changed = False
+
+    path = _listings_path()
+    tmp_path = "{}.tmp{}".format(path, threading.get_ident())
+    try:
+        utils.ensure_path_exists(os.path.dirname(path))
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except (IOError, OSError) as e:
+        utils.logv("Failed saving lib directory listings: {}", e)
+        utils.ensure_deleted(tmp_path)
+
+
+def list_lib_files(lib_dir, extensions):
+    """
+    Lists the files with ``extensions`` below ``lib_dir``, and every
+    directory walked. Each directory's listing is cached by its modification
+    time (and saved with ``save_lib_listings()``), so only directories whose
+    entries changed are listed again.
+
+    :returns: A tuple ``(files, dirs)``.
+    """
+    extensions = tuple(extensions)
+    files = []
+    dirs = []
+    pending = [lib_dir]
+
+    while pending:
+        dir = pending.pop()
+        try:
+            mtime = os.stat(dir).st_mtime_ns
+        except OSError:
+            continue
+
+        key = "{}:{}".format(",".join(extensions), dir)
+        listing = _get_listing(key)
+
+        if listing is None or listing[0] != mtime:
+            names = []
+            subdirs = []
+            with os.scandir(dir) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        subdirs.append(entry.path)
+                    elif entry.name.endswith(extensions):
+                        names.append(entry.path)
+            listing = [mtime, sorted(names), sorted(subdirs)]
+            _set_listing(key, listing)
+
+        dirs.append(dir)
+        files.extend(listing[1])
+        pending.extend(reversed(listing[2]))
+
+    return (files, dirs)
+
+
+def write_libs_manifest(lib_dirs, modules):
+    """
+    Writes the ``[{"file": ..., "expose": ...}]`` manifest read by the
+    ``browserify-manifest.js`` plugin, only touching it if it changed.
+
+    :returns: A tuple ``(path, digest)``.
+    """
+    data = json.dumps(modules, indent=0, sort_keys=True).encode("utf-8")
+    digest = hashlib.sha1(data).hexdigest()
+
+    key = [os.path.abspath(d) for d in lib_dirs]
+    key = hashlib.sha1(json.dumps(key).encode("utf-8")).hexdigest()
+    cache_dir = utils.get_cache_dir("browserify")
+    path = os.path.join(cache_dir, "libs-{}.json".format(key))
+
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return (path, digest)
+    except IOError:
+        pass
+
+    utils.ensure_path_exists(cache_dir)
+    tmp_path = "{}.tmp{}".format(path, threading.get_ident())
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return (path, digest)
 
 
 def browserify_libs(lib_dirs, output_file=None, release=False, list_deps=False, babelify=False):
@@ -109,21 +469,32 @@ def browserify_libs(lib_dirs, output_file=None, release=False, list_deps=False,
     cmdline.append("--no-bundle-external")
     cmdline.extend(params)
 
+    # The module list goes in a manifest file, since a -r argument per file
+    # can exceed the command line length limit for large trees
+    modules = []
+    all_dirs = []
     for dir in lib_dirs:
-        files = utils.list_matching_files(
-            dir, extensions=exts, recursive=True, linux_style_paths=True
-        )
+        files, dirs = list_lib_files(dir, exts)
+        all_dirs.extend(os.path.abspath(d) for d in dirs)
+
         dir = dir.replace("\\", "/")
         libname = os.path.basename(dir.rstrip("/\\"))
 
         for f in files:
+            f = f.replace("\\", "/")
             assert f.startswith(dir)
             newname = libname + os.path.splitext(f[len(dir) :])[0]
-            if not os.path.isabs(f):
-                f = "./" + f
-            cmdline.extend(["-r", "{}:{}".format(f, newname)])
+            modules.append({"file": os.path.abspath(f), "expose": newname})
 
-    return browserify_run(cmdline, errmsg, output_file, release, list_deps)
+    save_lib_listings()
+    manifest, digest = write_libs_manifest(lib_dirs, modules)
+    plugin = utils.get_js_path("browserify-manifest.js")
+    # The digest changes the command line when the manifest does, so
+    # persistent bundlers in watch mode are recreated with the new modules
+    cmdline.extend(["-p", "[", plugin, "--manifest", manifest, "--digest", digest, "]"])
+
+    # Depend on the directories too, so adding or removing a file triggers a rebuild
+    return browserify_run(cmdline, errmsg, output_file, release, list_deps) + all_dirs
 
 
 def browserify_file(
@@ -153,12 +524,61 @@ def browserify_file(
     return browserify_run(cmdline, errmsg, output_file, release, list_deps)
 
 
-def browserify_deps_node_modules(module_list, babelify=False):
-    return browserify_node_modules(module_list, list_deps=True, babelify=babelify)
+def browserify_factor_bundle(
+    entry_points,
+    output_file=None,
+    release=False,
+    list_deps=False,
+    babelify=False,
+    output_files=None,
+):
+    (_, params) = get_extensions_and_params(babelify=babelify)
+    errmsg = browserify_basic_error("browserify_factor_bundle", output_file, list_deps)
 
+    cmdline = browserify_basic_command(output_file, release, list_deps)
+    cmdline.append("--no-bundle-external")
+    cmdline.extend(params)
+    cmdline.extend(entry_points)
+
+    if not list_deps:
+        cmdline.extend(["-p", "[", utils.get_node_modules_dir("factor-bundle")])
+        for f in output_files:
+            utils.ensure_path_exists(os.path.dirname(f))
+            cmdline.extend(["-o", f])
+        cmdline.append("]")
+
+    try:
+        # factor-bundle writes the entry bundles through its own streams, which
+        # a worker can't wait for, so only the command line tool is sure to
+        # have finished them
+        result = browserify_run(cmdline, errmsg, output_file, release, list_deps, use_worker=False)
+        if release and not list_deps:
+            for f in output_files:
+                minify.minify_js([f], f, release=release)
+    except:
+        if not list_deps:
+            utils.ensure_deleted(*output_files)
+        raise
+
+    return result
+
+
+def browserify_deps_node_modules(module_list, babelify=False, track_by_lockfile=False):
+    return browserify_node_modules(
+        module_list, list_deps=True, babelify=babelify, track_by_lockfile=track_by_lockfile
+    )
 
-def browserify_compile_node_modules(module_list, output_file, release=False, babelify=False):
-    browserify_node_modules(module_list, output_file, release=release, babelify=babelify)
+
+def browserify_compile_node_modules(
+    module_list, output_file, release=False, babelify=False, track_by_lockfile=False
+):
+    return browserify_node_modules(
+        module_list,
+        output_file,
+        release=release,
+        babelify=babelify,
+        track_by_lockfile=track_by_lockfile,
+    )
 
 
 def browserify_deps_libs(lib_dirs, babelify=False):
@@ -166,7 +586,7 @@ def browserify_deps_libs(lib_dirs, babelify=False):
 
 
 def browserify_compile_libs(lib_dirs, output_file, release=False, babelify=False):
-    browserify_libs(lib_dirs, output_file, release=release, babelify=babelify)
+    return browserify_libs(lib_dirs, output_file, release=release, babelify=babelify)
 
 
 def browserify_deps_file(entry_point, babelify=False, export_as=None):
@@ -176,6 +596,18 @@ def browserify_deps_file(entry_point, babelify=False, export_as=None):
 def browserify_compile_file(
     entry_point, output_file, release=False, babelify=False, export_as=None
 ):
-    browserify_file(
+    return browserify_file(
         entry_point, output_file, release=release, babelify=babelify, export_as=export_as
     )
+
+
+def browserify_deps_factor_bundle(entry_points, babelify=False, output_files=None):
+    return browserify_factor_bundle(entry_points, list_deps=True, babelify=babelify)
+
+
+def browserify_compile_factor_bundle(
+    entry_points, output_file, release=False, babelify=False, output_files=None
+):
+    return browserify_factor_bundle(
+        entry_points, output_file, release=release, babelify=babelify, output_files=output_files
+    )
@@ -43,7 +43,7 @@ def copy_files(src_dir, dst_dir, filespec, recursive=False, release=None):
         utils.logv(">>> copy {} > {}".format(input, output))
         dirname = os.path.split(output)[0]
         if not os.path.exists(dirname):
-            os.makedirs(dirname)
+            os.makedirs(dirname, exist_ok=True)
         shutil.copy2(input, output)
 
     os.utime(dst_dir, None)
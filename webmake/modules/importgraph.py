@@ -0,0 +1,60 @@
+"""
+Index of the ``@import`` graph between stylesheets, shared by all LESS and
+SASS targets. Each file is parsed once for as long as its modification
+time and size are unchanged, so a partial imported by many files or
+targets is only read once per build (and once per change in watch mode).
+"""
+
+import os
+import threading
+from .. import statcache
+
+
+_lock = threading.Lock()
+_imports = {}
+
+
+def get_imports(read_imports_fn, file):
+    """
+    Returns the files directly imported by ``file``, as parsed by
+    ``read_imports_fn``, from the index if ``file`` hasn't changed.
+    """
+    st = statcache.stat(file)
+    if st is None:
+        raise FileNotFoundError(file)
+
+    key = (read_imports_fn, file)
+    version = (st.st_mtime_ns, st.st_size)
+
+    with _lock:
+        entry = _imports.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    imports = [os.path.abspath(p) for p in read_imports_fn(file)]
+    with _lock:
+        _imports[key] = (version, imports)
+    return imports
+
+
+def dependencies(read_imports_fn, root_file):
+    """
+    Returns ``root_file`` followed by every file it imports directly or
+    indirectly, each listed once. Import cycles are followed only once,
+    leaving the compiler to decide whether they're an error.
+    """
+    root_file = os.path.abspath(root_file)
+    deps = []
+    visited = set()
+
+    def visit(file):
+        if file in visited:
+            return
+        visited.add(file)
+        deps.append(file)
+
+        for imp in get_imports(read_imports_fn, file):
+            visit(imp)
+
+    visit(root_file)
+    return deps
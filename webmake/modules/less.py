@@ -1,6 +1,6 @@
 import os
 import re
-from . import utils
+from . import utils, importgraph, nodeworker
 
 
 LESS_IMPORT_RE = re.compile(r"""@import\s+['"](.+?(?:\.less)?)['"]\s*;""")
@@ -24,7 +24,7 @@ def _read_less_imports(file):
 
 
 def less_dependencies(input_file):
-    return utils.breadth_first_search(_read_less_imports, input_file)
+    return importgraph.dependencies(_read_less_imports, input_file)
 
 
 def less_compile(input_file, output_file, release=False):
@@ -46,10 +46,57 @@ def less_compile(input_file, output_file, release=False):
         output_file,
     ]
 
+    errmsg = 'Failed to compile LESS to "{}"'.format(output_file)
+
     try:
         utils.ensure_deleted(map_file)
-        utils.run_command(cmdline, 'Failed to compile LESS to "{}"'.format(output_file))
+        result = nodeworker.run(
+            "less",
+            errmsg,
+            input=input_file,
+            output=output_file,
+            compress=release,
+            sourceMap=None if release else map_file,
+        )
+        if result is None:
+            utils.run_command(cmdline, errmsg)
     except:
         utils.ensure_deleted(output_file)
         utils.ensure_deleted(map_file)
         raise
+
+
+def less_compile_batch(jobs, release=False):
+    """
+    Compiles several ``(input, output, kwargs)`` jobs in a single request
+    to a node worker, which reads each imported file once for all of them.
+
+    :returns: For each job, ``None`` or the ``StaticCompilerError`` raised.
+    """
+    requests = []
+    for input_file, output_file, _ in jobs:
+        map_file = output_file + ".map"
+        utils.ensure_deleted(map_file)
+        requests.append(
+            {
+                "input": input_file,
+                "output": output_file,
+                "compress": release,
+                "sourceMap": None if release else map_file,
+            }
+        )
+
+    result = nodeworker.run("less-batch", "Failed to compile LESS batch", jobs=requests)
+    if result is None:
+        return utils.compile_each(less_compile, jobs, release=release)
+
+    results = []
+    for (_, output_file, _), r in zip(jobs, result["results"]):
+        if "error" in r:
+            utils.ensure_deleted(output_file, output_file + ".map")
+            error = r["error"]
+            errmsg = 'Failed to compile LESS to "{}"'.format(output_file)
+            results.append(utils.StaticCompilerError(errmsg, error["message"], error["output"]))
+        else:
+            results.append(None)
+    return results
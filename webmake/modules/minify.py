@@ -1,5 +1,5 @@
 import os
-from . import utils, concat
+from . import utils, concat, nodeworker
 
 
 def minify_js(input_files, output_file, release=False):
@@ -22,8 +22,12 @@ def minify_js(input_files, output_file, release=False):
     ]
     cmdline.extend(input_files)
 
+    errmsg = 'Failed to minify JS to "{}"'.format(output_file)
+
     try:
-        utils.run_command(cmdline, 'Failed to minify JS to "{}"'.format(output_file))
+        result = nodeworker.run("uglify-js", errmsg, inputs=list(input_files), output=output_file)
+        if result is None:
+            utils.run_command(cmdline, errmsg)
     except:
         utils.ensure_deleted(output_file)
         raise
@@ -43,8 +47,12 @@ def minify_css(input_files, output_file, release=False):
         output_file,
     ]
 
+    errmsg = 'Failed to minify CSS to "{}"'.format(output_file)
+
     try:
-        utils.run_command(cmdline, 'Failed to minify CSS to "{}"'.format(output_file))
+        result = nodeworker.run("clean-css", errmsg, input=output_file, output=output_file)
+        if result is None:
+            utils.run_command(cmdline, errmsg)
     except:
         utils.ensure_deleted(output_file)
         raise
@@ -0,0 +1,210 @@
+"""
+Runs jobs on long-lived node worker processes (``webmake/js/worker.js``),
+which load each tool once instead of starting node for every compile.
+
+Workers are started on demand, one per concurrent job. Jobs with an
+``affinity`` always run on the same dedicated worker, so it can keep state
+between jobs (eg. a browserify module cache). A worker that crashes is
+replaced on the next job, and if workers can't be started or keep
+crashing, callers fall back to running the command line tools.
+"""
+
+import json
+import atexit
+import threading
+import subprocess
+from . import utils
+from .. import settings, profiler
+
+
+MAX_CRASHES = 3
+
+
+class WorkerCrashed(Exception):
+    pass
+
+
+class NodeWorker:
+    def __init__(self):
+        self.next_id = 0
+        self.process = subprocess.Popen(
+            ["node", utils.get_js_path("worker.js")],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+
+    def request(self, tool, args):
+        self.next_id += 1
+        request = {"id": self.next_id, "tool": tool, "args": args}
+
+        try:
+            self.process.stdin.write(json.dumps(request).encode("utf-8") + b"\n")
+            self.process.stdin.flush()
+            line = self.process.stdout.readline()
+        except (OSError, ValueError) as e:
+            raise WorkerCrashed(str(e))
+
+        if not line:
+            raise WorkerCrashed("Node worker exited with code {}".format(self.process.wait()))
+
+        try:
+            response = json.loads(line.decode("utf-8"))
+        except ValueError:
+            raise WorkerCrashed("Invalid response from node worker: {!r}".format(line[:200]))
+
+        if not isinstance(response, dict) or response.get("id") != request["id"]:
+            raise WorkerCrashed("Node worker response out of sequence")
+        return response
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.wait()
+        except OSError:
+            pass
+
+    def stop(self):
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=1)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+
+
+_lock = threading.Lock()
+_idle = []
+_busy = set()
+_dedicated = {}
+_crashes = 0
+_disabled = False
+
+
+def is_enabled():
+    return settings.NODE_WORKER and not _disabled
+
+
+def _acquire(affinity=None):
+    global _disabled
+    with _lock:
+        if affinity is not None and affinity in _dedicated:
+            return _dedicated.pop(affinity)
+        if affinity is None and _idle:
+            return _idle.pop()
+
+    try:
+        return NodeWorker()
+    except OSError as e:
+        _disabled = True
+        utils.logv("Unable to start node worker, using command line tools: {}", e)
+        return None
+
+
+def _crashed(worker, error):
+    global _crashes, _disabled
+    worker.kill()
+    with _lock:
+        _crashes += 1
+        if _crashes >= MAX_CRASHES:
+            _disabled = True
+    utils.logv("Node worker crashed, falling back to command line tool: {}", error)
+
+
+def _release(worker, affinity=None):
+    with _lock:
+        if affinity is not None:
+            _dedicated[affinity] = worker
+        else:
+            _idle.append(worker)
+
+
+def stop_dedicated(affinities):
+    """
+    Stops the dedicated workers for ``affinities``, eg. when their targets
+    are removed.
+    """
+    with _lock:
+        workers = [_dedicated.pop(a) for a in affinities if a in _dedicated]
+
+    for worker in workers:
+        worker.stop()
+
+
+def cancel_jobs():
+    """
+    Kills the shared workers running a job, so a cancelled build doesn't
+    wait for them. Dedicated workers finish their job, to keep their state.
+    """
+    with _lock:
+        workers = list(_busy)
+
+    for worker in workers:
+        worker.kill()
+
+
+def run(tool, errmsg, affinity=None, **args):
+    """
+    Runs ``tool`` with ``args`` on a node worker, or on the dedicated
+    worker for ``affinity`` if specified.
+
+    :returns: The tool's result dict, or ``None`` if no worker is available
+        and the caller should run the command line tool instead.
+    :raises StaticCompilerError: If the tool reports an error.
+    :raises CommandCancelled: If commands were cancelled with
+        ``utils.cancel_commands()``.
+    """
+    if utils.is_cancelled():
+        raise utils.CommandCancelled(errmsg)
+    if not is_enabled():
+        return None
+
+    worker = _acquire(affinity)
+    if worker is None:
+        return None
+
+    utils.logv(">>> [worker] {} {}", tool, args.get("output", ""))
+
+    if affinity is None:
+        with _lock:
+            _busy.add(worker)
+
+    try:
+        # Cancelled before cancel_jobs() could see this worker
+        if utils.is_cancelled():
+            _release(worker, affinity)
+            raise utils.CommandCancelled(errmsg)
+
+        with profiler.span("worker " + tool, "command"):
+            response = worker.request(tool, args)
+    except WorkerCrashed as e:
+        if utils.is_cancelled():
+            # Killed by cancel_jobs(), which isn't a crash
+            worker.kill()
+            raise utils.CommandCancelled(errmsg)
+        _crashed(worker, e)
+        return None
+    finally:
+        with _lock:
+            _busy.discard(worker)
+
+    if affinity is None and utils.is_cancelled():
+        # It may have been killed by cancel_jobs() just after responding
+        worker.kill()
+    else:
+        _release(worker, affinity)
+
+    if "error" in response:
+        error = response["error"]
+        raise utils.StaticCompilerError(errmsg, error.get("message"), error.get("output"))
+
+    return response["result"]
+
+
+@atexit.register
+def shutdown():
+    with _lock:
+        workers = list(_idle) + list(_dedicated.values())
+        del _idle[:]
+        _dedicated.clear()
+
+    for worker in workers:
+        worker.stop()
@@ -1,9 +1,20 @@
 import os
 import re
-from . import utils
+from . import utils, importgraph, nodeworker
 
 
-SASS_IMPORT_RE = re.compile(r"""@import\s+['"](.+?(?:\.s[ca]ss)?)['"]\s*;""")
+SASS_IMPORT_RE = re.compile(r"""@(import|use|forward)\s+['"](.+?(?:\.s[ca]ss)?)['"][^;]*;""")
+SASS_EXTENSIONS = [".scss", ".sass", ".css"]
+
+
+def _resolve_sass_import(imp, sass_dir):
+    dep = utils.resolve_possible_paths(imp, sass_dir, SASS_EXTENSIONS, leading_underscore=True)
+    if dep is None:
+        # A directory with an index file, eg. @use "components"
+        dep = utils.resolve_possible_paths(
+            os.path.join(imp, "index"), sass_dir, SASS_EXTENSIONS, leading_underscore=True
+        )
+    return dep
 
 
 def _read_sass_imports(file):
@@ -13,23 +24,33 @@ def _read_sass_imports(file):
     imports = SASS_IMPORT_RE.findall(sassfile)
     sass_dir = os.path.dirname(file)
 
-    for imp in imports:
-        dep = utils.resolve_possible_paths(
-            imp, sass_dir, [".scss", ".sass", ".css"], leading_underscore=True
-        )
+    for rule, imp in imports:
+        # Built in modules, eg. @use "sass:math"
+        if imp.startswith("sass:"):
+            continue
+
+        dep = _resolve_sass_import(imp, sass_dir)
         if dep:
             deps.append(dep)
-        else:
+        elif rule == "import":
             raise ValueError("Invalid SASS import in {}: {}".format(file, imp))
+        # Otherwise a @use or @forward of something outside the project, eg.
+        # from a load path, which the compiler reports if it's invalid
 
     return deps
 
 
 def sass_dependencies(input_file):
-    return utils.breadth_first_search(_read_sass_imports, input_file)
+    return importgraph.dependencies(_read_sass_imports, input_file)
 
 
 def sass_compile(input_file, output_file, release=False):
+    """
+    Compiles on a node worker through the Sass JS API if possible, which
+    returns the exact files loaded, otherwise with the command line tool.
+
+    :returns: The files loaded, or ``None`` if they weren't reported.
+    """
     map_file = output_file + ".map"
     output_style = "compressed" if release else "expanded"
     if release:
@@ -47,10 +68,57 @@ def sass_compile(input_file, output_file, release=False):
         output_file,
     ]
 
+    errmsg = 'Failed to compile SASS to "{}"'.format(output_file)
+
     try:
         utils.ensure_deleted(map_file)
-        utils.run_command(cmdline, 'Failed to compile SASS to "{}"'.format(output_file))
+        result = nodeworker.run(
+            "sass",
+            errmsg,
+            input=input_file,
+            output=output_file,
+            style=output_style,
+            sourceMap=None if release else map_file,
+        )
+        if result is None:
+            utils.run_command(cmdline, errmsg)
+            return None
     except:
         utils.ensure_deleted(output_file)
         utils.ensure_deleted(map_file)
         raise
+
+    return [os.path.abspath(p) for p in result["dependencies"]]
+
+
+def sass_compile_batch(jobs, release=False):
+    """
+    Compiles several ``(input, output, kwargs)`` jobs in a single run of
+    the command line tool, which parses shared partials once for all of
+    them. If it fails, each job is compiled separately to find which failed.
+
+    :returns: For each job, ``None`` or the ``StaticCompilerError`` raised.
+    """
+    output_style = "compressed" if release else "expanded"
+    source_map = "--no-source-map" if release else "--source-map"
+
+    cmdline = [
+        utils.get_node_bin_path("sass", "sass"),
+        "--style",
+        output_style,
+        "--quiet",
+        source_map,
+    ]
+
+    for input_file, output_file, _ in jobs:
+        utils.ensure_deleted(output_file + ".map")
+        cmdline.append("{}:{}".format(input_file, output_file))
+
+    try:
+        utils.run_command(cmdline, "Failed to compile SASS batch")
+    except utils.StaticCompilerError as e:
+        if isinstance(e, utils.CommandCancelled):
+            raise
+        return utils.compile_each(sass_compile, jobs, release=release)
+
+    return [None] * len(jobs)
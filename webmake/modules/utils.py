@@ -1,18 +1,32 @@
 import re
 import os
+import json
+import signal
+import tempfile
+import threading
 import subprocess
+import contextlib
 from subprocess import CalledProcessError
-from .. import settings
+from .. import settings, profiler
+
+
+_log_lock = threading.Lock()
+_log_local = threading.local()
 
 
 def log(msg, *args, **kwargs):
     """
     Print out a log message.
     """
-    if len(args) == 0 and len(kwargs) == 0:
-        print(msg)
+    if len(args) != 0 or len(kwargs) != 0:
+        msg = msg.format(*args, **kwargs)
+
+    buffer = getattr(_log_local, "buffer", None)
+    if buffer is not None:
+        buffer.append(msg)
     else:
-        print(msg.format(*args, **kwargs))
+        with _log_lock:
+            print(msg)
 
 
 def logv(msg, *args, **kwargs):
@@ -23,6 +37,26 @@ def logv(msg, *args, **kwargs):
         log(msg, *args, **kwargs)
 
 
+@contextlib.contextmanager
+def log_group():
+    """
+    Buffers all log messages from the current thread, and prints them
+    together on exit so output from parallel targets doesn't interleave.
+    """
+    if getattr(_log_local, "buffer", None) is not None:
+        yield
+        return
+
+    _log_local.buffer = []
+    try:
+        yield
+    finally:
+        buffer, _log_local.buffer = _log_local.buffer, None
+        if buffer:
+            with _log_lock:
+                print("\n".join(buffer))
+
+
 class StaticCompilerError(Exception):
     def __init__(self, message, error=None, output=None, source=None):
         super(StaticCompilerError, self).__init__()
@@ -48,20 +82,6 @@ class StaticCompilerError(Exception):
         return "".join(err)
 
 
-def breadth_first_search(get_deps_fn, root_file):
-    root_file = os.path.abspath(root_file)
-    queue = [root_file]
-    deps = [root_file]
-
-    while len(queue) > 0:
-        cur_file = queue.pop(0)
-        new_deps = get_deps_fn(cur_file)
-        queue.extend(new_deps)
-        deps.extend(new_deps)
-
-    return deps
-
-
 def list_matching_files(path, extensions=None, recursive=True, linux_style_paths=False):
     if isinstance(extensions, list):
         extensions = tuple(extensions)
@@ -89,7 +109,7 @@ def list_matching_files(path, extensions=None, recursive=True, linux_style_paths
 def ensure_path_exists(path):
     path = os.path.abspath(path)
     if not os.path.exists(path):
-        os.makedirs(path)
+        os.makedirs(path, exist_ok=True)
 
 
 def ensure_deleted(*args):
@@ -148,6 +168,42 @@ def get_node_bin_path(*args):
     return os.path.join(get_node_modules_dir(), *args)
 
 
+def get_cache_dir(*args):
+    """
+    Returns a directory under the webmakefile's cache directory, falling
+    back to the system temp directory if it isn't set.
+    """
+    return os.path.join(settings.CACHE_DIR or tempfile.gettempdir(), *args)
+
+
+def get_js_path(name):
+    """
+    Returns the path to one of webmake's own node scripts.
+    """
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, "js", name))
+
+
+def get_node_module_version(module):
+    """
+    :returns: The version of an installed node module, or ``None``.
+    """
+    try:
+        with open(os.path.join(get_node_modules_dir(module), "package.json")) as f:
+            return json.load(f).get("version")
+    except (IOError, ValueError):
+        return None
+
+
+def relative_path(path):
+    """
+    Returns ``path`` relative to the current (project) directory if possible.
+    """
+    try:
+        return os.path.relpath(path)
+    except ValueError:
+        return path
+
+
 def no_dependencies(input):
     if not isinstance(input, (list, tuple)):
         return [input]
@@ -155,6 +211,75 @@ def no_dependencies(input):
         return input
 
 
+def _command_name(cmd):
+    """
+    Returns the node module name of the tool run by ``cmd``, for profiling.
+    """
+    marker = "node_modules" + os.sep
+    if marker in cmd:
+        return cmd.split(marker, 1)[1].split(os.sep, 1)[0]
+    return cmd.split(" ", 1)[0]
+
+
+_commands_lock = threading.Lock()
+_commands = set()
+_cancelled = threading.Event()
+
+
+class CommandCancelled(StaticCompilerError):
+    def __str__(self):
+        return "\nCancelled: " + self.message
+
+
+def _start_command(cmd, errmsg, **kwargs):
+    if _cancelled.is_set():
+        raise CommandCancelled(errmsg)
+
+    # In its own process group, so cancelling also kills its children
+    proc = subprocess.Popen(cmd, start_new_session=True, **kwargs)
+    with _commands_lock:
+        _commands.add(proc)
+    return proc
+
+
+def _finish_command(proc):
+    with _commands_lock:
+        _commands.discard(proc)
+    if proc.poll() is None:
+        _kill(proc)
+
+
+def _kill(proc):
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except OSError:
+        pass
+
+
+def cancel_commands():
+    """
+    Kills all running commands, and makes new ones fail with
+    ``CommandCancelled`` until ``reset_cancelled()`` is called. Used by
+    the watcher to abandon a build when newer changes invalidate it.
+    """
+    _cancelled.set()
+    with _commands_lock:
+        procs = list(_commands)
+    for proc in procs:
+        _kill(proc)
+
+
+def reset_cancelled():
+    _cancelled.clear()
+
+
+def is_cancelled():
+    return _cancelled.is_set()
+
+
 def run_command(cmd, errmsg, env=None, with_node=True):
     if env is not None:
         newenv = os.environ.copy()
@@ -169,13 +294,105 @@ def run_command(cmd, errmsg, env=None, with_node=True):
 
     try:
         logv(">>> " + cmd)
-        return subprocess.check_output(cmd, env=env, stderr=subprocess.STDOUT, shell=True).decode(
-            "ascii", "replace"
-        )
+        with profiler.span(_command_name(cmd), "command"):
+            proc = _start_command(
+                cmd, errmsg, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, shell=True
+            )
+            try:
+                output, _ = proc.communicate()
+            finally:
+                _finish_command(proc)
+
+        if proc.returncode != 0:
+            if _cancelled.is_set():
+                raise CommandCancelled(errmsg)
+            raise CalledProcessError(proc.returncode, cmd, output)
+        return output.decode("ascii", "replace")
     except CalledProcessError as e:
         raise StaticCompilerError(errmsg, str(e), e.output.decode("ascii", "replace"))
 
 
+def run_pipeline(cmds, errmsg, env=None):
+    """
+    Runs node commands with the stdout of each piped into the next, like
+    ``node a | node b``, but fails if any of them fails.
+    """
+    if env is not None:
+        newenv = os.environ.copy()
+        newenv.update(env)
+        env = newenv
+
+    cmds = [["node"] + [c for c in cmd if c != ""] for cmd in cmds]
+    logv(">>> " + " | ".join(" ".join(cmd) for cmd in cmds))
+
+    procs = []
+    errors = []
+    with profiler.span(" | ".join(_command_name(" ".join(cmd)) for cmd in cmds), "command"):
+        try:
+            stdin = None
+            for i, cmd in enumerate(cmds):
+                last = i == len(cmds) - 1
+                errors.append(tempfile.TemporaryFile())
+                try:
+                    proc = _start_command(
+                        cmd,
+                        errmsg,
+                        env=env,
+                        stdin=stdin,
+                        stdout=errors[-1] if last else subprocess.PIPE,
+                        stderr=errors[-1],
+                    )
+                except OSError as e:
+                    raise StaticCompilerError(
+                        errmsg, "Unable to run '{}': {}".format(" ".join(cmd), e)
+                    )
+                # Let the previous process get SIGPIPE if this one exits
+                if stdin is not None:
+                    stdin.close()
+                stdin = proc.stdout
+                procs.append(proc)
+
+            codes = [p.wait() for p in procs]
+            failed = [(cmd, code) for cmd, code in zip(cmds, codes) if code != 0]
+
+            output = []
+            for f in errors:
+                f.seek(0)
+                output.append(f.read().decode("ascii", "replace"))
+        finally:
+            for p in procs:
+                _finish_command(p)
+            for f in errors:
+                f.close()
+
+    if failed and _cancelled.is_set():
+        raise CommandCancelled(errmsg)
+    if failed:
+        cmd, code = failed[0]
+        raise StaticCompilerError(
+            errmsg,
+            "Command '{}' returned non-zero exit status {}.".format(" ".join(cmd), code),
+            "".join(output),
+        )
+
+
+def compile_each(compiler_fn, jobs, release=False):
+    """
+    Compiles a batch of ``(input, output, kwargs)`` jobs one at a time,
+    eg. when they can't be compiled together.
+
+    :returns: The result of ``compiler_fn`` for each job, or the
+        ``StaticCompilerError`` it raised.
+    """
+    results = []
+    for input, output, kwargs in jobs:
+        try:
+            results.append(compiler_fn(input, output, release=release, **kwargs))
+        except StaticCompilerError as e:
+            results.append(e)
+    return results
+
+
 def extract_line_num(output, regexp):
     m = re.search(regexp, output)
     if m:
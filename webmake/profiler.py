@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import threading
+import contextlib
+from . import settings
+
+
+_lock = threading.Lock()
+_local = threading.local()
+_events = []
+_threads = {}
+_epoch = time.perf_counter()
+
+
+@contextlib.contextmanager
+def span(name, category, target=None):
+    """
+    Records the time spent inside the ``with`` block when profiling.
+    Spans inside a span for a ``target`` are attributed to that target.
+    """
+    if not settings.PROFILE:
+        yield
+        return
+
+    outer_target = getattr(_local, "target", None)
+    target = target or outer_target
+    _local.target = target
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        _local.target = outer_target
+        with _lock:
+            tid = _threads.setdefault(threading.get_ident(), len(_threads) + 1)
+            _events.append(
+                {
+                    "name": name,
+                    "cat": category,
+                    "ph": "X",
+                    "ts": round((start - _epoch) * 1e6),
+                    "dur": round((end - start) * 1e6),
+                    "pid": os.getpid(),
+                    "tid": tid,
+                    "args": {"target": target} if target else {},
+                }
+            )
+
+
+def report():
+    """
+    Prints the time spent per phase and per target, slowest first.
+    """
+    from .modules.utils import log
+
+    with _lock:
+        events = list(_events)
+
+    phases = {}
+    targets = {}
+    for e in events:
+        count, total = phases.get(e["cat"], (0, 0))
+        phases[e["cat"]] = (count + 1, total + e["dur"])
+
+        target = e["args"].get("target")
+        if target:
+            times = targets.setdefault(target, {})
+            times[e["cat"]] = times.get(e["cat"], 0) + e["dur"]
+
+    lines = ["\nPROFILE\n", "{:<20} {:>8} {:>12}".format("Phase", "Count", "Total (s)")]
+    for cat, (count, total) in sorted(phases.items(), key=lambda p: -p[1][1]):
+        lines.append("{:<20} {:>8} {:>12.3f}".format(cat, count, total / 1e6))
+
+    # Commands run inside the compile phase, so don't count towards the total
+    columns = ["check", "compile", "command", "dependencies"]
+    for times in targets.values():
+        times["total"] = sum(times.get(c, 0) for c in columns if c != "command")
+    columns.append("total")
+
+    lines.append("")
+    lines.append("{:<40}".format("Target") + "".join("{:>14}".format(c) for c in columns))
+    for target, times in sorted(targets.items(), key=lambda t: -t[1]["total"]):
+        lines.append(
+            "{:<40}".format(target)
+            + "".join("{:>14.3f}".format(times.get(c, 0) / 1e6) for c in columns)
+        )
+
+    log("\n".join(lines))
+
+
+def write_trace(path):
+    """
+    Writes all recorded spans in Chrome trace event format, which can be
+    loaded into ``chrome://tracing`` or https://ui.perfetto.dev
+    """
+    with _lock:
+        trace = {"traceEvents": list(_events), "displayTimeUnit": "ms"}
+
+    with open(path, "w") as f:
+        json.dump(trace, f)
+
+
+def finish(trace_path):
+    """
+    Prints the report and writes the trace file for the current build, then
+    starts recording again from scratch.
+    """
+    from .modules.utils import log
+
+    if not settings.PROFILE:
+        return
+
+    report()
+    write_trace(trace_path)
+    log("\nWrote trace: {}", trace_path)
+
+    with _lock:
+        _events.clear()
@@ -0,0 +1,101 @@
+import io
+import os
+import shutil
+import tarfile
+import threading
+import urllib.error
+import urllib.request
+from . import settings
+from .modules.utils import log, logv
+
+
+_lock = threading.Lock()
+_disabled = set()
+
+
+def _url(key):
+    return "{}/{}/{}.tar".format(settings.REMOTE_CACHE_URL.rstrip("/"), key[:2], key)
+
+
+def _disable(mode, reason):
+    with _lock:
+        if mode in _disabled:
+            return
+        _disabled.add(mode)
+    log("\nRemote build cache {} disabled, falling back to local builds: {}", mode, reason)
+
+
+def is_enabled(mode="read"):
+    return bool(settings.REMOTE_CACHE_URL) and mode not in _disabled
+
+
+def fetch(key, entry_dir):
+    """
+    Downloads the artifact ``key`` from the remote cache, and unpacks it
+    into the local cache as ``entry_dir``.
+
+    :returns: ``True`` on a hit, ``False`` on a miss or if the remote cache
+        is unreachable.
+    """
+    if not is_enabled("read"):
+        return False
+
+    try:
+        with urllib.request.urlopen(_url(key), timeout=settings.REMOTE_CACHE_TIMEOUT) as resp:
+            data = resp.read()
+    except urllib.error.HTTPError as e:
+        if e.code != 404:
+            _disable("read", e)
+        return False
+    except (urllib.error.URLError, OSError) as e:
+        _disable("read", e)
+        return False
+
+    tmp_dir = "{}.tmp{}".format(entry_dir, threading.get_ident())
+    try:
+        os.makedirs(tmp_dir, exist_ok=True)
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            for member in tar.getmembers():
+                # Only accept plain files directly inside the entry
+                if not member.isfile() or os.path.basename(member.name) != member.name:
+                    raise tarfile.TarError("Invalid member {}".format(member.name))
+                src = tar.extractfile(member)
+                with open(os.path.join(tmp_dir, member.name), "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+        os.rename(tmp_dir, entry_dir)
+    except (tarfile.TarError, IOError, OSError) as e:
+        logv("Invalid remote build cache entry {}: {}", key, e)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return os.path.isdir(entry_dir)
+
+    logv("Fetched from remote build cache: {}", key)
+    return True
+
+
+def upload(key, entry_dir):
+    """
+    Uploads the local cache entry ``entry_dir`` to the remote cache as ``key``.
+    """
+    if not settings.REMOTE_CACHE_WRITE or not is_enabled("write"):
+        return
+
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        for name in sorted(os.listdir(entry_dir)):
+            tar.add(os.path.join(entry_dir, name), arcname=name)
+
+    req = urllib.request.Request(
+        _url(key),
+        data=buf.getvalue(),
+        method="PUT",
+        headers={"Content-Type": "application/x-tar"},
+    )
+
+    try:
+        with urllib.request.urlopen(req, timeout=settings.REMOTE_CACHE_TIMEOUT):
+            pass
+    except (urllib.error.URLError, OSError) as e:
+        _disable("write", e)
+        return
+
+    logv("Uploaded to remote build cache: {}", key)
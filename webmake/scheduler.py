@@ -0,0 +1,70 @@
+import heapq
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .modules import utils
+
+
+def run(targets, predecessors, build_fn, jobs=1, keep_going=False, on_complete=None):
+    """
+    Calls ``build_fn(target)`` for each of ``targets``, running up to
+    ``jobs`` of them at a time on a pool of worker threads.
+
+    ``predecessors[i]`` is a collection of indexes into ``targets`` which
+    must complete before ``targets[i]`` is started, so targets run in
+    topological order. Ready targets are started in list order.
+    ``build_fn`` returns ``False`` on failure, after which no new targets
+    are started. If ``keep_going`` is set, only targets which depend on a
+    failed target are skipped, and everything else is still built.
+
+    ``on_complete(target, result)`` is called from the calling thread as
+    each target finishes, so it's safe to update shared state from it.
+
+    :returns: A list with the result of ``build_fn`` for each target, or
+        ``None`` for targets that were never started.
+    """
+    jobs = max(1, jobs or 1)
+    waiting = [set(p) for p in predecessors]
+    dependents = [[] for _ in targets]
+    for i, preds in enumerate(predecessors):
+        for p in preds:
+            dependents[p].append(i)
+
+    ready = [i for i, w in enumerate(waiting) if not w]
+    heapq.heapify(ready)
+    results = [None] * len(targets)
+    failed = False
+
+    def complete(i, result):
+        nonlocal failed
+        results[i] = result
+        if on_complete:
+            on_complete(targets[i], result)
+        if result is False:
+            failed = not keep_going
+            return
+        for j in dependents[i]:
+            waiting[j].discard(i)
+            if not waiting[j]:
+                heapq.heappush(ready, j)
+
+    if jobs == 1:
+        while ready and not failed:
+            i = heapq.heappop(ready)
+            complete(i, build_fn(targets[i]))
+        return results
+
+    def build_grouped(target):
+        with utils.log_group():
+            return build_fn(target)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        running = {}
+        while running or (ready and not failed):
+            while ready and not failed and len(running) < jobs:
+                i = heapq.heappop(ready)
+                running[executor.submit(build_grouped, targets[i])] = i
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                complete(running.pop(future), future.result())
+
+    return results
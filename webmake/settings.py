@@ -7,6 +7,48 @@ RELEASE = False
 # Whether to force compilation of all files, rather than compiling modified
 FORCE = False
 
+# Whether to check dependencies by content fingerprint rather than modification time
+CONTENT_HASH = False
+
+# Whether to keep compiling independent targets after a failure
+KEEP_GOING = False
+
+# Maximum number of targets to compile in parallel
+JOBS = 1
+
+# Whether to record timings, print a report and write a trace file after each build
+PROFILE = False
+
+# Whether to run less, uglify-js and clean-css on persistent node workers
+NODE_WORKER = True
+
+# Directory for webmake's caches, defaults to "webmakefile.py.cache" next to the makefile
+CACHE_DIR = None
+
+# Whether to restore unchanged outputs from the local build cache instead of compiling
+BUILD_CACHE = False
+
+# Maximum size of the local build cache in bytes, least recently used entries are evicted
+BUILD_CACHE_SIZE = 500 * 1024 * 1024
+
+# Maximum size of the cache of babel-transformed files in bytes, least recently used are evicted
+TRANSFORM_CACHE_SIZE = 200 * 1024 * 1024
+
+# Base URL of a shared build cache, which artifacts are fetched from with GET and added to with PUT
+REMOTE_CACHE_URL = None
+
+# Whether to upload newly compiled artifacts to the remote build cache
+REMOTE_CACHE_WRITE = True
+
+# Timeout in seconds for remote build cache requests
+REMOTE_CACHE_TIMEOUT = 5
+
+# Whether running in watch mode
+WATCH = False
+
 # The makefile contents & path, and dependencies map
 MAKEFILE = None
 MAKEFILEPATH = None
+
+# Absolute output paths or glob patterns of the targets to build, or all if empty
+TARGET_PATTERNS = []
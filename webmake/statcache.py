@@ -0,0 +1,95 @@
+import os
+import threading
+
+
+_lock = threading.Lock()
+_dirs = {}
+_stats = {}
+
+
+def _scan(dirname):
+    try:
+        with os.scandir(dirname) as it:
+            return {entry.name: entry for entry in it}
+    except OSError:
+        return None
+
+
+def stat(path):
+    """
+    Returns the ``os.stat_result`` for ``path`` (following symlinks), or
+    ``None`` if it doesn't exist. Results are cached until ``invalidate()``
+    or ``reset()`` is called. Each directory is listed once with ``os.scandir()``,
+    so missing files cost nothing and every existing file is stat'ed at most once.
+    """
+    path = os.path.abspath(path)
+
+    with _lock:
+        if path in _stats:
+            return _stats[path]
+
+        dirname, name = os.path.split(path)
+        if dirname not in _dirs:
+            _dirs[dirname] = _scan(dirname)
+        entries = _dirs[dirname]
+
+        try:
+            if not name or entries is None:
+                result = os.stat(path)
+            elif name in entries:
+                result = entries[name].stat()
+            else:
+                result = None
+        except OSError:
+            result = None
+
+        _stats[path] = result
+        return result
+
+
+def exists(path):
+    return stat(path) is not None
+
+
+def getmtime(path):
+    """
+    Cached version of ``os.path.getmtime()``.
+    """
+    st = stat(path)
+    if st is None:
+        raise FileNotFoundError(path)
+    return st.st_mtime
+
+
+def invalidate(paths, recursive=False):
+    """
+    Forgets the cached state of each of ``paths`` and its directory listing,
+    and of the directory containing it, whose modification time changes when
+    files are created or deleted. If ``recursive``, also forgets everything
+    below each path.
+    """
+    with _lock:
+        for path in paths:
+            path = os.path.abspath(path)
+            parent = os.path.dirname(path)
+            _stats.pop(path, None)
+            _stats.pop(parent, None)
+            _dirs.pop(path, None)
+            _dirs.pop(parent, None)
+            # The parent's stat is cached in its own directory's listing
+            _dirs.pop(os.path.dirname(parent), None)
+
+            if recursive:
+                prefix = path + os.sep
+                for cache in (_stats, _dirs):
+                    for p in [p for p in cache if p.startswith(prefix)]:
+                        del cache[p]
+
+
+def reset():
+    """
+    Forgets all cached state, eg. at the start of a new build pass.
+    """
+    with _lock:
+        _dirs.clear()
+        _stats.clear()
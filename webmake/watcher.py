@@ -1,6 +1,7 @@
-import itertools
 import os
+import sys
 import signal
+import importlib
 import time
 import threading
 
@@ -9,22 +10,129 @@ from watchdog.events import FileSystemEventHandler
 from watchdog.observers import Observer
 from watchdog.observers.polling import PollingObserver
 
-from . import compiler, settings
+from . import compiler, depscache, graph, livereload, settings, statcache
+from .modules import browserify, nodeworker
+from .modules import utils
 from .modules.utils import log
 
 
 DEBOUNCE_DELAY = 0.3
 
 
+class DependencyIndex:
+    """
+    Maps each dependency path of the targets to the targets using it, so
+    changed paths can be turned into the targets to rebuild without
+    checking every target.
+    """
+
+    def __init__(self, targets):
+        self.targets = targets
+        self.paths = {}
+        self.target_paths = [set() for _ in targets]
+        self.directories = self.update(range(len(targets)))
+
+    def update(self, indexes):
+        """
+        Re-indexes the dependencies of the targets at ``indexes``, eg. after
+        they're recompiled, and the graph between all targets, since those
+        may now include another target's outputs.
+
+        :returns: The directories to watch for those dependencies.
+        """
+        makefilepath = os.path.abspath(settings.MAKEFILEPATH)
+        directories = set()
+
+        for i in indexes:
+            for path in self.target_paths[i]:
+                users = self.paths.get(path)
+                if users:
+                    users.discard(i)
+                    if not users:
+                        del self.paths[path]
+
+            deps = set(os.path.abspath(p) for p in self.targets[i].get("dependencies") or ())
+            deps.update(graph.target_inputs(self.targets[i]))
+            deps.discard(makefilepath)
+
+            self.target_paths[i] = deps
+            for path in deps:
+                self.paths.setdefault(path, set()).add(i)
+                directories.add(os.path.dirname(path))
+                # Directory dependencies, eg. browserify lib dirs
+                if os.path.isdir(path):
+                    directories.add(path)
+
+        self.predecessors = graph.build_graph(self.targets)
+        self.outputs = set(o for t in self.targets for o in graph.target_outputs(t))
+        return directories
+
+    def affected(self, changed):
+        """
+        :returns: The sorted indexes of the targets depending on any of the
+            ``changed`` paths (or a directory containing them), plus all
+            targets downstream of those.
+        """
+        result = set()
+        for path in changed:
+            path = os.path.abspath(path)
+            result.update(self.paths.get(path, ()))
+            result.update(self.paths.get(os.path.dirname(path), ()))
+
+        result |= graph.descendants(self.predecessors, result)
+        return sorted(result)
+
+    def is_output(self, path):
+        """
+        Checks whether ``path`` is written by a target (or inside a
+        directory written by one).
+        """
+        path = os.path.abspath(path)
+        return path in self.outputs or os.path.dirname(path) in self.outputs
+
+
+def output_mtimes(targets):
+    result = {}
+    for target in targets:
+        for output in graph.target_outputs(target):
+            try:
+                result[output] = os.stat(output).st_mtime_ns
+            except OSError:
+                pass
+    return result
+
+
 class WatchdogEventHandler(FileSystemEventHandler):
-    def __init__(self, signal_exit):
+    """
+    Collects changed paths, which a single build loop thread turns into
+    rebuilds. Changes affecting a build in progress cancel it, and it's
+    restarted with all changes once they settle.
+    """
+
+    def __init__(self, signal_exit, watch_directory, livereload_enabled=False):
         self.signal_exit = signal_exit
-        self.timer = None
+        self.watch_directory = watch_directory
+        self.livereload_enabled = livereload_enabled
+        self.index = DependencyIndex(settings.MAKEFILE)
+        self.condition = threading.Condition()
+        self.changed = set()
+        self.last_change = 0
+        self.building = set()
+        self.stopped = False
+        self.thread = threading.Thread(target=self.build_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
 
     def on_any_event(self, event):
+        # Ignore webmake's own files next to the makefile, eg. the dependencies cache
+        makefile_prefix = os.path.abspath(settings.MAKEFILEPATH) + "."
         if (
             event.is_directory
-            or event.src_path.endswith(".depscache")
+            or os.path.abspath(event.src_path).startswith(makefile_prefix)
             or event.event_type
             in (
                 events.EVENT_TYPE_OPENED,
@@ -34,36 +142,158 @@ class WatchdogEventHandler(FileSystemEventHandler):
         ):
             return
 
-        if os.path.abspath(event.src_path) == os.path.abspath(settings.MAKEFILEPATH):
-            log(
-                "Detected change to makefile {}, please restart the watcher.\n".format(
-                    settings.MAKEFILEPATH
-                )
-            )
-            self.signal_exit()
-            return
-
         what = "directory" if event.is_directory else "file"
         log("{} {} {}".format(event.event_type.title(), what, event.src_path))
 
-        if self.timer:
-            self.timer.cancel()
-        self.timer = threading.Timer(DEBOUNCE_DELAY, self.on_timer)
-        self.timer.start()
+        changed = [event.src_path]
+        if getattr(event, "dest_path", None):
+            changed.append(event.dest_path)
+        statcache.invalidate(changed)
+        browserify.invalidate_bundles(changed)
 
-    def on_timer(self):
-        compiler.compile_if_modified(settings.MAKEFILE, settings.MAKEFILEPATH, settings.RELEASE)
-        log("Build complete.\n")
+        with self.condition:
+            self.changed.update(changed)
+            self.last_change = time.monotonic()
 
+            # Outputs are written by the build itself, so don't cancel it for those
+            sources = [p for p in changed if not self.index.is_output(p)]
+            makefilepath = os.path.abspath(settings.MAKEFILEPATH)
+            makefile_changed = makefilepath in (os.path.abspath(p) for p in changed)
+            affected = self.index.affected(sources)
+            if self.building and (makefile_changed or self.building.intersection(affected)):
+                if not utils.is_cancelled():
+                    log("Cancelling build, restarting with new changes...\n")
+                    utils.cancel_commands()
+                    nodeworker.cancel_jobs()
 
-def start_watching(use_polling_watcher=False):
-    settings.VERBOSE = True
+            self.condition.notify()
+
+    def reload_makefile(self):
+        """
+        Re-imports the makefile and replaces the targets. Targets whose
+        output and configuration are unchanged keep their dependencies, and
+        any persistent compiler workers.
+
+        :returns: The indexes of the new or changed targets, plus everything
+            downstream of them.
+        """
+        log("Reloading makefile {}\n".format(settings.MAKEFILEPATH))
+
+        name = os.path.splitext(os.path.basename(settings.MAKEFILEPATH))[0]
+        try:
+            module = importlib.reload(sys.modules[name])
+            targets = module.MAKEFILE
+        except Exception as e:  # pylint: disable=broad-except
+            log("\nERROR: Unable to reload makefile, keeping the previous targets:\n{}\n", e)
+            return set()
+
+        makefilepath = settings.MAKEFILEPATH
+        old = {}
+        for target in settings.MAKEFILE:
+            old[(os.path.abspath(target["output"]), depscache.target_config_hash(target))] = target
+
+        new = []
+        for target in targets:
+            key = (os.path.abspath(target["output"]), depscache.target_config_hash(target))
+            previous = old.pop(key, None)
+            if previous is None or "dependencies" not in previous:
+                new.append(target)
+                continue
 
-    paths = itertools.chain.from_iterable(d["dependencies"] for d in settings.MAKEFILE)
-    paths = set(os.path.abspath(os.path.dirname(p)) for p in paths)
+            # The makefile changed, but not in a way that matters to this target
+            target["dependencies"] = [d for d in previous["dependencies"] if d != makefilepath]
+            if previous.get("fingerprints") is not None:
+                target["fingerprints"] = dict(previous["fingerprints"])
+                target["fingerprints"].pop(makefilepath, None)
 
-    # import pprint
-    # pprint.pprint(paths, indent=4)
+        nodeworker.stop_dedicated([key[0] for key in old])
+        compiler.load_dependencies_from_cache(new, makefilepath)
+
+        if settings.TARGET_PATTERNS:
+            targets = compiler.select_targets(targets, settings.TARGET_PATTERNS)
+
+        settings.MAKEFILE = targets
+        with self.condition:
+            self.index = DependencyIndex(targets)
+            for path in self.index.directories:
+                self.watch_directory(path)
+
+        ids = set(id(t) for t in new)
+        indexes = set(i for i, t in enumerate(targets) if id(t) in ids)
+        return indexes | graph.descendants(self.index.predecessors, indexes)
+
+    def wait_for_changes(self):
+        """
+        Waits until changes have settled for ``DEBOUNCE_DELAY``.
+
+        :returns: The changed paths, or ``None`` when stopped.
+        """
+        with self.condition:
+            while not self.stopped:
+                if self.changed:
+                    delay = self.last_change + DEBOUNCE_DELAY - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self.condition.wait(delay)
+                else:
+                    self.condition.wait()
+
+            if self.stopped:
+                return None
+
+            changed, self.changed = self.changed, set()
+            return changed
+
+    def build_loop(self):
+        while True:
+            changed = self.wait_for_changes()
+            if changed is None:
+                return
+
+            makefilepath = os.path.abspath(settings.MAKEFILEPATH)
+            reloaded = set()
+            if makefilepath in (os.path.abspath(p) for p in changed):
+                reloaded = self.reload_makefile()
+
+            with self.condition:
+                indexes = sorted(set(self.index.affected(changed)) | reloaded)
+                self.building = set(indexes)
+                utils.reset_cancelled()
+
+            if not indexes:
+                continue
+
+            targets = [settings.MAKEFILE[i] for i in indexes]
+            before = output_mtimes(targets)
+            compiler.compile_if_modified(targets, settings.MAKEFILEPATH, settings.RELEASE)
+            after = output_mtimes(targets)
+
+            with self.condition:
+                self.building = set()
+
+                # Dependencies may have changed, and be in new directories
+                for path in self.index.update(indexes):
+                    self.watch_directory(path)
+
+                # Rebuild everything the cancelled build covered, with the new changes
+                if utils.is_cancelled():
+                    self.changed.update(changed)
+                    continue
+
+            log("Build complete.\n")
+
+            if self.livereload_enabled:
+                outputs = [p for p in after if after[p] != before.get(p)]
+                if outputs:
+                    livereload.notify(outputs)
+
+
+def start_watching(use_polling_watcher=False, livereload_port=None):
+    settings.VERBOSE = True
+    settings.WATCH = True
+
+    if livereload_port is not None and not livereload.start(livereload_port):
+        sys.exit(1)
 
     # Use the polling observer instead of inotify if polling was requested
     if use_polling_watcher:
@@ -77,14 +307,27 @@ def start_watching(use_polling_watcher=False):
 
     def signal_exit(sig=None, frame=None):
         log("Shutting down...")
+        handler.stop()
         observer.stop()
         nonlocal shutdown
         shutdown = True
 
-    for path in paths:
-        observer.schedule(WatchdogEventHandler(signal_exit), path, recursive=False)
+    watched = set()
+
+    def watch_directory(path):
+        if path not in watched and os.path.isdir(path):
+            watched.add(path)
+            observer.schedule(handler, path, recursive=False)
+
+    handler = WatchdogEventHandler(signal_exit, watch_directory, livereload_port is not None)
+    watch_directory(os.path.dirname(os.path.abspath(settings.MAKEFILEPATH)))
+    for path in handler.index.directories:
+        watch_directory(path)
     observer.start()
 
+    # Anything could have changed before the observer started
+    statcache.reset()
+
     signal.signal(signal.SIGINT, signal_exit)
     signal.signal(signal.SIGTERM, signal_exit)
 